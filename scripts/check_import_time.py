@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Check that `import sgminigrid` stays within an import time budget and only
+runs the registration path. Exits with status 1 when over budget or when
+it loads one of HEAVY_MODULES.
+
+The budget is on the wall time of `import sgminigrid` in a fresh
+interpreter, gymnasium and the env plugins it loads included (about 0.5s
+on a dev machine, nearly all of it minigrid and matplotlib). None of
+HEAVY_MODULES may be in sys.modules afterwards, except those the other
+env plugins load anyway (minigrid imports matplotlib).
+"""
+
+import subprocess
+import sys
+
+# modules sgminigrid must not import at registration, with their submodules
+HEAVY_MODULES = (
+    'matplotlib',
+    'pygame',
+    'minigrid.wrappers',
+    'minigrid.core.roomgrid',
+    'sgminigrid.envs',
+    'sgminigrid.sgminigrid_env',
+    'sgminigrid.rendering',
+    'sgminigrid.crafting_oracle',
+    'sgminigrid.oracle_dataset',
+    'sgminigrid.wrappers',
+    'sgminigrid.vector',
+    'sgminigrid.benchmark',
+)
+
+_PROBE = "import time; t = time.perf_counter(); import sgminigrid; print(time.perf_counter() - t)"
+
+
+def import_wall_s():
+    """Wall time in s of `import sgminigrid` in a fresh interpreter"""
+    out = subprocess.run([sys.executable, "-c", _PROBE], capture_output=True, text=True, check=True).stdout
+    return float(out.splitlines()[-1])
+
+
+# imports gymnasium with the sgminigrid plugin stubbed out, so only the other
+# env plugins (minigrid imports matplotlib) load
+_PLUGINS_PROBE = """
+import sys, types
+stub = types.ModuleType('sgminigrid')
+stub.__path__ = []
+stub.register_sgminigrid_envs = lambda: None
+sys.modules['sgminigrid'] = sys.modules['sgminigrid.__init__'] = stub
+import gymnasium
+print(' '.join(sys.modules))
+"""
+
+
+def _modules(code):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return set(out.splitlines()[-1].split())
+
+
+def heavy_imports():
+    """HEAVY_MODULES in sys.modules after `import sgminigrid` that no other plugin loads"""
+    extra = _modules("import sys, sgminigrid; print(' '.join(sys.modules))") - _modules(_PLUGINS_PROBE)
+    return sorted(m for m in extra if any(m == h or m.startswith(h + '.') for h in HEAVY_MODULES))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-s", default=1.0, type=float, help="max wall time of import sgminigrid")
+    parser.add_argument("--repeats", default=5, type=int, help="best of n runs")
+    args = parser.parse_args()
+
+    wall = min(import_wall_s() for _ in range(args.repeats))
+    print(f"import sgminigrid: {wall * 1000:.0f}ms (budget {args.budget_s * 1000:.0f}ms)")
+
+    heavy = heavy_imports()
+    for name in heavy:
+        print(f"error: import sgminigrid loads {name}")
+    ok = not heavy
+    if wall > args.budget_s:
+        print("error: over budget")
+        ok = False
+    sys.exit(0 if ok else 1)
@@ -1,10 +1,9 @@
 from __future__ import annotations
 
+# Only registration happens at import, env modules are imported through
+# their entry point strings when an id is made
 from gymnasium.envs.registration import register
 
-from minigrid import minigrid_env, wrappers
-from minigrid.core import roomgrid
-
 def register_sgminigrid_envs():
     register(
         id="SGMG-ButtonTest-v0",
@@ -0,0 +1,147 @@
+"""
+Throughput benchmarks for the registered SGMG envs.
+
+    python -m sgminigrid.benchmark --out bench.json
+"""
+from __future__ import annotations
+
+import fnmatch
+import platform
+import time
+import tracemalloc
+
+import gymnasium as gym
+import numpy as np
+
+from sgminigrid.wrappers import CompactCraftObsWrapper
+
+
+def env_ids(pattern='SGMG-*'):
+    return sorted(k for k in gym.registry if fnmatch.fnmatch(k, pattern))
+
+
+def make_env(env_id, compact=False, full_obs=False, **kwargs):
+    if full_obs:
+        # full_obs envs emit the compact grid, the wrapper passes them through
+        return CompactCraftObsWrapper(gym.make(env_id, full_obs=True, **kwargs))
+    env = gym.make(env_id, **kwargs)
+    if compact:
+        env = CompactCraftObsWrapper(env)
+    return env
+
+
+def make_oracle(env):
+    """Oracle actor for a compact crafting env"""
+    from sgminigrid.crafting_oracle import CraftingOracleActor, HLCraftingOracleActor
+
+    if env.unwrapped.compose:
+        return HLCraftingOracleActor(None, None, env.observation_space, env.action_space)
+    return CraftingOracleActor(None, None, env.observation_space, env.action_space)
+
+
+def _latency_stats(ns):
+    ns = np.asarray(ns, dtype=np.float64)
+    return {
+        'mean_us': float(ns.mean() / 1e3),
+        'p50_us': float(np.percentile(ns, 50) / 1e3),
+        'p99_us': float(np.percentile(ns, 99) / 1e3),
+    }
+
+
+def _run(env, steps, seed, actor=None, act_ns=None, observe_ns=None):
+    """Step env for `steps` steps, returning per step latencies in ns"""
+    rng = np.random.default_rng(seed)
+    episode = 0
+    obs, info = env.reset(seed=seed)
+    if actor is not None:
+        t = time.perf_counter_ns()
+        actor.observe_first(obs, info)
+        observe_ns.append(time.perf_counter_ns() - t)
+
+    step_ns = np.zeros(steps, dtype=np.int64)
+    for i in range(steps):
+        if actor is None:
+            action = int(rng.integers(env.action_space.n))
+        else:
+            t = time.perf_counter_ns()
+            action = actor.act()
+            act_ns.append(time.perf_counter_ns() - t)
+
+        t = time.perf_counter_ns()
+        obs, reward, terminated, truncated, info = env.step(action)
+        step_ns[i] = time.perf_counter_ns() - t
+
+        if terminated or truncated:
+            episode += 1
+            obs, info = env.reset(seed=seed + episode)
+            if actor is not None:
+                t = time.perf_counter_ns()
+                actor.observe_first(obs, info)
+                observe_ns.append(time.perf_counter_ns() - t)
+        elif actor is not None:
+            actor.observe(obs, action, info)
+    return step_ns
+
+
+def bench_env(env_id, compact=False, steps=2000, resets=200, seed=0, policy='random', memory_steps=500, full_obs=False):
+    """
+    Steps/s, resets/s, step latency and peak traced memory of one env.
+    With policy='oracle' a compact or full_obs crafting env is driven by
+    the oracle and its observe_first/act latencies are reported too.
+    """
+    env = make_env(env_id, compact, full_obs)
+    use_oracle = policy == 'oracle' and (compact or full_obs) and env_id.startswith('SGMG-Crafting')
+    result = {}
+
+    env.reset(seed=seed)
+    t = time.perf_counter()
+    for i in range(resets):
+        env.reset(seed=seed + i)
+    result['resets_per_s'] = resets / (time.perf_counter() - t)
+
+    actor = make_oracle(env) if use_oracle else None
+    act_ns, observe_ns = [], []
+    step_ns = _run(env, steps, seed, actor, act_ns, observe_ns)
+    result['steps_per_s'] = float(steps / (step_ns.sum() / 1e9))
+    result['step'] = _latency_stats(step_ns)
+    if use_oracle:
+        result['oracle_act'] = _latency_stats(act_ns)
+        result['oracle_observe_first'] = _latency_stats(observe_ns)
+
+    # separate pass, tracemalloc slows everything down
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    _run(env, memory_steps, seed, make_oracle(env) if use_oracle else None, [], [])
+    result['peak_mem_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+
+    env.close()
+    return result
+
+
+def run(pattern='SGMG-*', steps=2000, resets=200, seed=0, policy='random'):
+    import minigrid
+
+    results = {}
+    for env_id in env_ids(pattern):
+        results[env_id] = {
+            'raw': bench_env(env_id, False, steps, resets, seed, policy),
+            'compact': bench_env(env_id, True, steps, resets, seed, policy),
+        }
+        if env_id.startswith('SGMG-Crafting'):# the only envs with full_obs
+            results[env_id]['full_obs'] = bench_env(env_id, False, steps, resets, seed, policy, full_obs=True)
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'gymnasium': gym.__version__,
+            'minigrid': getattr(minigrid, '__version__', None),
+            'steps': steps,
+            'resets': resets,
+            'seed': seed,
+            'policy': policy,
+        },
+        'results': results,
+    }
@@ -0,0 +1,30 @@
+import argparse
+import json
+
+from sgminigrid.benchmark import run
+
+parser = argparse.ArgumentParser(prog="python -m sgminigrid.benchmark")
+parser.add_argument("--envs", default="SGMG-*", help="glob over registered env ids")
+parser.add_argument("--steps", type=int, default=2000)
+parser.add_argument("--resets", type=int, default=200)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--policy", choices=["random", "oracle"], default="random", help="oracle drives the compact crafting envs")
+parser.add_argument("--out", default=None, help="json output path, printed if not given")
+args = parser.parse_args()
+
+report = run(args.envs, args.steps, args.resets, args.seed, args.policy)
+for env_id, res in report['results'].items():
+    raw, compact = res['raw'], res['compact']
+    variants = f"{compact['steps_per_s']:9.0f} compact"
+    if 'full_obs' in res:
+        variants += f", {res['full_obs']['steps_per_s']:9.0f} full_obs"
+    line = f"{env_id:36s} steps/s {raw['steps_per_s']:9.0f} ({variants})  resets/s {raw['resets_per_s']:8.0f}  p99 {raw['step']['p99_us']:7.1f}us"
+    if 'oracle_act' in compact:
+        line += f"  oracle act {compact['oracle_act']['p50_us']:.1f}us"
+    print(line)
+
+if args.out is None:
+    print(json.dumps(report, indent=2))
+else:
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from copy import deepcopy
 import numpy as np
 import itertools as it
@@ -23,33 +24,116 @@ def _get_neighbors(x, y, d, border):
         result.append(((x+xd, y+yd, d), MiniGridEnv.Actions.forward))
     return result
 
-def _get_r_neighbors(x, y, d, border):
-    xd, yd = DIR_MAP[d]
-    result = [((x, y, (d-1)%4), MiniGridEnv.Actions.right), ((x, y, ((d+1)%4)), MiniGridEnv.Actions.left)]
-    if not border[x-xd, y-yd]:
-        result.append(((x-xd, y-yd, d), MiniGridEnv.Actions.forward))
-    return result
+def _forward(a, fill):
+    """
+    Value of the cell one step ahead: b[..., x, y, d] = a[..., x+dx, y+dy, d]
+    for (dx, dy) = DIR_MAP[d]
+    """
+    b = np.full_like(a, fill)
+    b[..., :-1, :, 0] = a[..., 1:, :, 0]
+    b[..., :, :-1, 1] = a[..., :, 1:, 1]
+    b[..., 1:, :, 2] = a[..., :-1, :, 2]
+    b[..., :, 1:, 3] = a[..., :, :-1, 3]
+    return b
+
+def _fill_flow(flow, border):
+    """
+    Relax flow[..., x, y, d] (steps to the goal) over the reversed
+    left/right/forward transitions until it stops changing, expanding
+    the whole wavefront of every leading slice at once
+    """
+    free = ~border[..., None]
+    fill = np.iinfo(flow.dtype).max - 1
+    while True:
+        best = np.minimum(np.roll(flow, 1, axis=-1), np.roll(flow, -1, axis=-1))
+        np.minimum(best, _forward(flow, fill), out=best)
+        new_flow = np.where(free, np.minimum(flow, best + 1), flow)
+        if (new_flow == flow).all():
+            return
+        flow[...] = new_flow
+
+def _build_flow(base_grid, orders):
+    """
+    Steps to complete each sequence of `orders` missions from every
+    (x, y, dir) state of an agent-free compact grid
+    """
+    h, w = base_grid.shape
+    border = base_grid == 2
+    flow = np.full((*([MISSIONS]*orders), h, w, 4), 3 * h * w + 4, dtype=np.int_)
+
+    # states facing each mission object, from a free cell
+    seeds = []
+    for obj_id in MISSION_OBJ:
+        goal = np.repeat((base_grid == obj_id)[:, :, None], 4, axis=-1)
+        seeds.append(_forward(goal, False) & ~border[:, :, None])
+    seeds = np.stack(seeds)
+
+    for order in range(orders):
+        perms = list(it.permutations(range(MISSIONS), order+1))
+        nth_order_missions = []
+        prev_order_missions = []
+        for missions in perms:
+            nth_order_mission = missions + (missions[-1],) * (orders - order - 1)
+            assert len(nth_order_mission) == orders
+            nth_order_missions.append(nth_order_mission)
+            prev_order_missions.append(missions[1:] + (missions[-1],) * (orders - order))
+        nth_idx = tuple(np.array(nth_order_missions).T)
+        prev_idx = tuple(np.array(prev_order_missions).T)
+
+        # relax all missions of this order together
+        cur_flow = flow[nth_idx]
+        seed = seeds[[missions[0] for missions in perms]]
+        if order == 0:
+            cur_flow[seed] = 1
+        else:
+            cur_flow[seed] = flow[prev_idx][seed] + 1
+        _fill_flow(cur_flow, border)
+        flow[nth_idx] = cur_flow
+    return flow
+
+class FlowCache(object):
+    """
+    Bounded LRU cache of oracle flow maps keyed by the agent-free compact
+    grid and the planning order. Pass one instance to several actors to
+    share it within a process.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._flows = OrderedDict()
+
+    @staticmethod
+    def key(base_grid, orders):
+        return (orders, base_grid.shape, base_grid.tobytes())
+
+    def get(self, key):
+        flow = self._flows.get(key)
+        if flow is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._flows.move_to_end(key)
+        return flow
+
+    def put(self, key, flow):
+        flow.flags.writeable = False# shared between actors
+        self._flows[key] = flow
+        self._flows.move_to_end(key)
+        while len(self._flows) > self.maxsize:
+            self._flows.popitem(last=False)
+
+    def clear(self):
+        self._flows.clear()
+        self.hits = 0
+        self.misses = 0
 
-def _goal_neighbors(x, y, border):
-    return [
-        ((x-DIR_MAP[d][0], y-DIR_MAP[d][1], d), MiniGridEnv.Actions.toggle)
-        for d in range(4)
-        if not border[x-DIR_MAP[d][0], y-DIR_MAP[d][1]]
-    ]
-
-def _fill_flow(reachable_q, flow, border):
-    while len(reachable_q) > 0:
-        state = reachable_q.pop(0)
-        dist = flow[state]
-        for nstate, _ in _get_r_neighbors(*state, border):
-            ndist = flow[nstate]
-            if dist + 1 < ndist:
-                flow[nstate] = dist + 1
-                reachable_q.append(nstate)
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._flows), 'maxsize': self.maxsize}
 
 class CraftingOracleAgent():
     TAGS = []
-    def __init__(self, args, env, rng, nth_order=1):
+    def __init__(self, args, env, rng, nth_order=1, flow_cache=None):
         self.args = args
         self.rng = rng
         assert isinstance(env, CompactCraftObsWrapper)
@@ -57,7 +141,7 @@ class CraftingOracleAgent():
         self.observation_space = deepcopy(env.observation_space)
         self.observation_space['mission_id'].n = 6# override environment to have 6 goals
         self.action_space = env.action_space
-        self.actor = CraftingOracleActor(self.args, self.rng, self.observation_space, self.action_space, nth_order=nth_order)
+        self.actor = CraftingOracleActor(self.args, self.rng, self.observation_space, self.action_space, nth_order=nth_order, flow_cache=flow_cache)
 
     def get_train_actor(self):
         return self.actor
@@ -85,7 +169,7 @@ class BaseLearner(object):
         pass
 
 class CraftingOracleActor(object):
-    def __init__(self, args, rng, observation_space, action_space, nth_order=1):
+    def __init__(self, args, rng, observation_space, action_space, nth_order=1, flow_cache=None):
         self.args = args
         self.rng = rng
         self.observation_space = observation_space
@@ -96,6 +180,9 @@ class CraftingOracleActor(object):
         self.flow = None
         self.border = None
         self.orders = nth_order
+        if flow_cache is None:
+            flow_cache = FlowCache()
+        self.flow_cache = flow_cache
 
     def observe_first(self, obs, infos):
         self.last_obs = obs
@@ -107,29 +194,13 @@ class CraftingOracleActor(object):
         if (self.base_grid == new_base_grid).all():
             return
 
-        # build flow map
         self.base_grid = new_base_grid
         self.border = self.base_grid == 2
-        self.flow = np.full((*([MISSIONS]*self.orders), self.h, self.w, 4), 3 * self.h * self.w + 4, dtype=np.int_)
-
-        for order in range(self.orders):
-            for missions in it.permutations(range(MISSIONS), order+1):
-                reachable_q = []
-                nth_order_mission = missions + (missions[-1],) * (self.orders - order - 1)
-                prev_order_mission = missions[1:] + (missions[-1],) * (self.orders - order)
-                assert len(nth_order_mission) == self.orders
-                obj_id = MISSION_OBJ[missions[0]]
-                x_goal, y_goal = np.where(self.base_grid == obj_id)
-                cur_flow = self.flow[nth_order_mission]
-                prev_flow = self.flow[prev_order_mission]
-                for i in range(x_goal.shape[0]):
-                    for (x, y, d), _ in _goal_neighbors(x_goal[i], y_goal[i], self.border):
-                        if order == 0:
-                            cur_flow[x, y, d] = 1
-                        else:
-                            cur_flow[x, y, d] = prev_flow[x, y, d] + 1
-                        reachable_q.append((x, y, d))
-                _fill_flow(reachable_q, cur_flow, self.border)
+        key = self.flow_cache.key(self.base_grid, self.orders)
+        self.flow = self.flow_cache.get(key)
+        if self.flow is None:
+            self.flow = _build_flow(self.base_grid, self.orders)
+            self.flow_cache.put(key, self.flow)
 
     def observe(self, next_obs, action, infos):
         self.last_obs = next_obs
@@ -160,23 +231,23 @@ class CraftingOracleActor(object):
 
 class HLCraftingOracleAgent(CraftingOracleAgent):
     TAGS = []
-    def __init__(self, args, env, rng, nth_order=1):
+    def __init__(self, args, env, rng, nth_order=1, flow_cache=None):
         self.args = args
         self.rng = rng
         # assert isinstance(env, CompactCraftObsWrapper)
         self.observation_space = env.observation_space
         assert self.observation_space['mission_id'].n == 8
         self.action_space = env.action_space
-        self.actor = HLCraftingOracleActor(self.args, self.rng, self.observation_space, self.action_space, nth_order=nth_order)
+        self.actor = HLCraftingOracleActor(self.args, self.rng, self.observation_space, self.action_space, nth_order=nth_order, flow_cache=flow_cache)
 
 class HLCraftingOracleActor(object):
-    def __init__(self, args, rng, observation_space, action_space, nth_order=1):
+    def __init__(self, args, rng, observation_space, action_space, nth_order=1, flow_cache=None):
         self.args = args
         self.rng = rng
         self.observation_space = observation_space
         self.action_space = action_space
 
-        self.ll_actor = CraftingOracleActor(args, rng, observation_space, action_space, nth_order=nth_order)
+        self.ll_actor = CraftingOracleActor(args, rng, observation_space, action_space, nth_order=nth_order, flow_cache=flow_cache)
         self.orders = nth_order
 
     def observe_first(self, obs, infos):
@@ -208,3 +279,125 @@ class HLCraftingOracleActor(object):
         hl_action = hl_action + (hl_action[-1],) * (self.orders - len(hl_action))
         a = self.ll_actor.act(missions=hl_action)
         return a
+
+class BatchCraftingOracleActor(object):
+    """
+    CraftingOracleActor over B envs at once: observations are stacked
+    dicts of arrays and act() returns B actions
+    """
+    def __init__(self, args, rng, observation_space, action_space, num_envs, nth_order=1, flow_cache=None):
+        self.args = args
+        self.rng = rng
+        self.observation_space = observation_space
+        self.action_space = action_space
+        self.num_envs = num_envs
+
+        self.h, self.w = self.observation_space['image'].shape
+        self.orders = nth_order
+        if flow_cache is None:
+            flow_cache = FlowCache()
+        self.flow_cache = flow_cache
+
+        self.flows = np.zeros((num_envs, *([MISSIONS]*self.orders), self.h, self.w, 4), dtype=np.int_)
+        self.border = np.ones((num_envs, self.h, self.w), dtype=np.bool_)
+        self._idx = np.arange(num_envs)
+
+    def observe_first(self, obs, infos, mask=None):
+        """Start new episodes for all envs, or those selected by `mask`"""
+        self.last_obs = obs
+        self.last_infos = infos
+
+        idx = self._idx if mask is None else self._idx[np.asarray(mask)]
+        for i in idx:
+            base_grid = obs['image'][i].copy()
+            base_grid[base_grid == AGENT_ID] = 1# remove agent
+            key = self.flow_cache.key(base_grid, self.orders)
+            flow = self.flow_cache.get(key)
+            if flow is None:
+                flow = _build_flow(base_grid, self.orders)
+                self.flow_cache.put(key, flow)
+            self.flows[i] = flow
+            self.border[i] = base_grid == 2
+
+    def observe(self, next_obs, action, infos):
+        self.last_obs = next_obs
+        self.last_infos = infos
+
+    def act(self, accum=None, missions=None, include_terminal=False):
+        """`missions` is a (B, nth_order) array, by default mission_id repeated"""
+        if missions is None:
+            missions = np.repeat(np.asarray(self.last_obs['mission_id'])[:, None], self.orders, axis=1)
+        assert missions.shape == (self.num_envs, self.orders)
+
+        idx = self._idx
+        image = np.asarray(self.last_obs['image']).reshape(self.num_envs, -1)
+        pos = (image == AGENT_ID).argmax(axis=1)
+        x, y = pos // self.w, pos % self.w
+        d = np.asarray(self.last_obs['direction'])
+
+        cur_flow = self.flows[(idx, *missions.T)]
+        max_dist = cur_flow[idx, x, y, d]
+
+        # neighbor states in the order left, right, forward
+        fx, fy = x + DIR_MAP[d, 0], y + DIR_MAP[d, 1]
+        dists = np.stack([
+            cur_flow[idx, x, y, (d - 1) % 4],
+            cur_flow[idx, x, y, (d + 1) % 4],
+            np.where(self.border[idx, fx, fy], np.iinfo(cur_flow.dtype).max, cur_flow[idx, fx, fy, d]),
+        ], axis=1)
+        best = dists.argmin(axis=1)
+        moves = np.array([MiniGridEnv.Actions.left, MiniGridEnv.Actions.right, MiniGridEnv.Actions.forward])
+        a = np.where(dists[idx, best] < max_dist, moves[best], MiniGridEnv.Actions.toggle)
+        if include_terminal:
+            return a, (a == MiniGridEnv.Actions.toggle)
+        else:
+            return a
+
+class BatchHLCraftingOracleActor(object):
+    """
+    HLCraftingOracleActor over B envs, planning every sketch with array ops
+    """
+    def __init__(self, args, rng, observation_space, action_space, num_envs, nth_order=1, flow_cache=None):
+        self.args = args
+        self.rng = rng
+        self.observation_space = observation_space
+        self.action_space = action_space
+        self.num_envs = num_envs
+
+        self.ll_actor = BatchCraftingOracleActor(args, rng, observation_space, action_space, num_envs, nth_order=nth_order, flow_cache=flow_cache)
+        self.orders = nth_order
+        self.seen_completed = np.zeros((num_envs, *self.observation_space['completion'].shape), np.bool_)
+
+    def observe_first(self, obs, infos, mask=None):
+        self.last_obs = obs
+        self.last_infos = infos
+        self.ll_actor.observe_first(obs, infos, mask=mask)
+
+        if mask is None:
+            self.seen_completed[:] = False
+        else:
+            self.seen_completed[np.asarray(mask)] = False
+
+    def observe(self, next_obs, action, infos):
+        self.last_obs = next_obs
+        self.last_infos = infos
+        self.ll_actor.observe(next_obs, action, infos)
+
+    def act(self, accum=None):
+        sketch = np.array(self.last_obs['sketch'])
+        # shears plan can be shortened
+        shears = (sketch == [1, 5, 3, 5]).all(axis=1)
+        sketch[shears] = [1, 3, 5, 0]
+        self.seen_completed |= np.asarray(self.last_obs['completion'], dtype=np.bool_)
+
+        # sketch entries that are not padding and not completed, kept in order
+        subgoals = np.maximum(sketch - 1, 0)
+        todo = (sketch > 0) & ~np.take_along_axis(self.seen_completed, subgoals, axis=1)
+        order = np.argsort(~todo, axis=1, kind='stable')
+        plan = np.take_along_axis(subgoals, order, axis=1)
+
+        # first nth_order steps of the plan, repeating the last one
+        n_todo = todo.sum(axis=1)
+        steps = np.minimum(np.arange(self.orders)[None], np.maximum(n_todo - 1, 0)[:, None])
+        hl_action = np.take_along_axis(plan, steps, axis=1)
+        return self.ll_actor.act(missions=hl_action)
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
-from minigrid.core.constants import COLOR_NAMES
-from minigrid.core.grid import Grid
+from minigrid.core.constants import COLOR_NAMES, IDX_TO_COLOR
 from minigrid.core.mission import MissionSpace
 from minigrid.core.world_object import Door, Goal, Key
 from sgminigrid.sgminigrid_env import SGMiniGridEnv
-from sgminigrid.sgworld_object import Button, ButtonDoor
+from sgminigrid.sgworld_object import NEW_OBJECT_TO_IDX, Button, ButtonDoor
 
 class ButtonDoorFullEnv(SGMiniGridEnv):
+    SUPPORTS_LAYOUT_BANK = True
+    PICKLE_SKIP = SGMiniGridEnv.PICKLE_SKIP + ('colors', 'button_completion_ids', 'door_completion_ids')
 
     def __init__(self, size=8, num_colors=6, num_extra_buttons=2, max_steps: int | None = None, generalize=True, full_task=True, gen_class='zeroshot', **kwargs):
         if max_steps is None:
@@ -27,6 +28,14 @@ class ButtonDoorFullEnv(SGMiniGridEnv):
             mission_space=mission_space, completion_space=completion_space,
             grid_size=size, max_steps=max_steps, **kwargs
         )
+        self.button_completion_ids = {
+            c: self.completion_lookup.mission_to_id[self._gen_mission(c)]
+            for c in self.colors
+        }
+        self.door_completion_ids = {
+            c: self.completion_lookup.mission_to_id[self._gen_mission(c, 'buttondoor')]
+            for c in self.colors
+        }
 
     def train(self):
         if self.generalize:
@@ -51,7 +60,7 @@ class ButtonDoorFullEnv(SGMiniGridEnv):
         buttons_after_door = []
 
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = self._make_grid(width, height)
 
         # Generate the surrounding walls
         self.grid.wall_rect(0, 0, width, height)
@@ -135,7 +144,7 @@ class ButtonDoorFullEnv(SGMiniGridEnv):
 
         if is_door_task:
             self.mission = self._gen_mission(self.door.color, obj_type='buttondoor')
-            self.goal_func = lambda: self.door.is_open
+            self.goal_button = None
         else:
             # Select goal button
             if goal_passed_door:
@@ -146,7 +155,6 @@ class ButtonDoorFullEnv(SGMiniGridEnv):
 
             #self.task_infos['tags'].append(self.goal_button.color)
             self.mission = self._gen_mission(self.goal_button.color, obj_type='button')
-            self.goal_func = lambda: self.goal_button.is_pressed
 
         # Place the agent
         if agent_passed_door:
@@ -154,12 +162,38 @@ class ButtonDoorFullEnv(SGMiniGridEnv):
         else:
             self.place_agent(size=(splitIdx, height))
         
-    def _subtask_completions(self):
-        completion = {}
+    def _decode_obj(self, type_idx, color_idx, state):
+        if type_idx == NEW_OBJECT_TO_IDX['buttondoor']:
+            return ButtonDoor(None, IDX_TO_COLOR[color_idx], state == 0)# linked to its button in _load_layout
+        return super()._decode_obj(type_idx, color_idx, state)
+
+    def _load_layout(self, layout):
+        super()._load_layout(layout)
+        self.allbuttons = {}
+        for obj in self.grid.grid:
+            if isinstance(obj, Button):
+                self.allbuttons[obj.color] = obj
+            elif isinstance(obj, ButtonDoor):
+                self.door = obj
+        # the door has the color of its button
+        self.door.button = self.allbuttons[self.door.color]
+
+        if self.mission == self._gen_mission(self.door.color, obj_type='buttondoor'):
+            self.goal_button = None
+        else:
+            self.goal_button = next(b for c, b in self.allbuttons.items() if self._gen_mission(c) == self.mission)
+
+    def goal_func(self):
+        # the door task has no goal button
+        if self.goal_button is None:
+            return self.door.is_open
+        return self.goal_button.is_pressed
+
+    def _update_completions(self, completion):
+        completion[:] = False
         for c, button in self.allbuttons.items():
-            completion[self._gen_mission(c)] = button.is_pressed
-        completion[self._gen_mission(self.door.color, 'buttondoor')] = self.door.is_open
-        return completion
+            completion[self.button_completion_ids[c]] = button.is_pressed
+        completion[self.door_completion_ids[self.door.color]] = self.door.is_open
 
     def step(self, action):
         obs, reward, terminated, truncated, info = super().step(action)
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-from minigrid.core.grid import Grid
 from minigrid.core.mission import MissionSpace
 from minigrid.core.world_object import Door, Goal, Key
 from sgminigrid.sgminigrid_env import SGMiniGridEnv
@@ -60,7 +59,7 @@ class ButtonEnv(SGMiniGridEnv):
 
     def _gen_grid(self, width, height):
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = self._make_grid(width, height)
 
         # Generate the surrounding walls
         self.grid.wall_rect(0, 0, width, height)
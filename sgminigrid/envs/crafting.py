@@ -1,14 +1,14 @@
 from __future__ import annotations
+import functools
 import types
 import math
 
 from gymnasium import spaces
-from minigrid.core.constants import COLOR_NAMES
-from minigrid.core.grid import Grid
+from minigrid.core.constants import COLOR_NAMES, IDX_TO_COLOR
 from minigrid.core.mission import MissionSpace
 from minigrid.core.world_object import Door, Goal, Key, Ball, Wall
 from sgminigrid.sgminigrid_env import SGMiniGridEnv
-from sgminigrid.sgworld_object import Button, ButtonDoor, Collectible, Interactable
+from sgminigrid.sgworld_object import NEW_OBJECT_TO_IDX, Button, ButtonDoor, Collectible, Interactable
 import numpy as np
 
 LL_TASKS = ['wood', 'grass', 'iron', 'toolshed', 'workbench', 'factory']
@@ -47,7 +47,120 @@ SUBGOAL_REWARDS['bed'] = ['wood', 'plank', 'grass']
 SUBGOAL_REWARDS['axe'] = ['wood', 'stick', 'iron']
 SUBGOAL_REWARDS['shears'] = ['wood', 'stick', 'iron']
 
+# Crafting state is a bitmask over TASKS
+TASKS = LL_TASKS + HL_TASKS
+TASK_TO_ID = {task: i for i, task in enumerate(TASKS)}
+TASK_BITS = {task: 1 << i for i, task in enumerate(TASKS)}
+
+TOOLS = ['toolshed', 'workbench', 'factory']
+TOOL_SHIFT = TASK_TO_ID[TOOLS[0]]
+assert [TASK_TO_ID[t] - TOOL_SHIFT for t in TOOLS] == list(range(len(TOOLS)))
+
+# (ingredients, product) rules of each tool, applied in order
+RECIPES = {
+    'toolshed': [(['wood'], 'plank'), (['grass'], 'rope'), (['stick', 'iron'], 'axe')],
+    'workbench': [(['wood'], 'stick'), (['plank', 'grass'], 'bed'), (['stick', 'iron'], 'shears')],
+    'factory': [(['grass'], 'cloth'), (['iron', 'wood'], 'bridge')],
+}
+
+def task_mask(tasks):
+    mask = 0
+    for t in tasks:
+        mask |= TASK_BITS[t]
+    return mask
+
+TOOL_MASK = task_mask(TOOLS)
+SUBGOAL_REWARD_MASKS = {task: task_mask(SUBGOAL_REWARDS[task]) for task in TASKS}
+
+def _compile_recipes():
+    """
+    CRAFT_TABLE[used, state] holds the bits crafted from `state` when the
+    tools in the bitmask `used` (bit k is TOOLS[k]) were just used
+    """
+    states = np.arange(1 << len(TASKS), dtype=np.int64)
+    table = np.zeros((1 << len(TOOLS), states.shape[0]), dtype=np.uint16)
+    for used in range(1 << len(TOOLS)):
+        new_states = states.copy()
+        for k, tool in enumerate(TOOLS):
+            if not (used >> k) & 1:
+                continue
+            for ingredients, product in RECIPES[tool]:
+                need = task_mask(ingredients)
+                new_states[(new_states & need) == need] |= TASK_BITS[product]
+        table[used] = new_states & ~states
+    return table
+
+CRAFT_TABLE = _compile_recipes()
+
+@functools.lru_cache(maxsize=None)
+def fixed_layout(size, n_objs, outer_place, seed=42):
+    """
+    Object positions of the fixed_pos layout, found by replaying the
+    rejection sampling they were originally placed with so the layout
+    stays the same
+    """
+    rng = np.random.default_rng(seed)
+    free = np.zeros((size, size), dtype=np.bool_)
+    free[1:-1, 1:-1] = True# inside the walls
+    if outer_place:
+        free[2:size-2, 2:size-2] = False
+    positions = []
+    while len(positions) < n_objs:
+        pos = (int(rng.integers(0, size)), int(rng.integers(0, size)))
+        if free[pos]:
+            free[pos] = False
+            positions.append(pos)
+    return tuple(positions)
+
+def outer_reject_fn(env, pos):
+    """reject_fn of outer_place, keeps objects on the two outer rings"""
+    size = env.size
+    return not((pos[0] < 2) or (pos[1] < 2)\
+        or (pos[0] > size-3) or (pos[1] > size-3))
+
+class CraftState(object):
+    """
+    Crafting state as an integer bitmask over TASKS, with dict style
+    access by task name for the world objects that update it
+    """
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    def __getitem__(self, task):
+        return bool(self.bits & TASK_BITS[task])
+
+    def __setitem__(self, task, value):
+        if value:
+            self.bits |= TASK_BITS[task]
+        else:
+            self.bits &= ~TASK_BITS[task]
+
+    def __iter__(self):
+        return iter(TASKS)
+
+    def __len__(self):
+        return len(TASKS)
+
+    def craft(self, prev_bits):
+        """Apply the recipes of the tools used since prev_bits"""
+        used = ((self.bits & ~prev_bits) & TOOL_MASK) >> TOOL_SHIFT
+        self.bits |= int(CRAFT_TABLE[used, self.bits])
+
 class Crafting(SGMiniGridEnv):
+    PROFILE_PHASES = {
+        **SGMiniGridEnv.PROFILE_PHASES,
+        '_update_state': 'step.update_state',
+        '_reward': 'step.reward',
+        '_update_dist_field': 'dist_field',
+    }
+    SUPPORTS_LAYOUT_BANK = True
+    LOSSLESS_COMPACT = True# object colors follow from obj_id
+    FULL_OBS_HIGH = 11# as CompactCraftObsWrapper
+    PICKLE_SKIP = SGMiniGridEnv.PICKLE_SKIP + (
+        'place_holders', 'reject_fn', 'pos_grid',
+        'completion_tasks', 'completion_ids', 'completion_shifts',
+    )
+
     def __init__(
         self,
         size=10,
@@ -67,10 +180,7 @@ class Crafting(SGMiniGridEnv):
         else:
             self.place_holders = [LL_TASKS]
         if outer_place:
-            def reject_fn(env, pos):
-                return not((pos[0] < 2) or (pos[1] < 2)\
-                    or (pos[0] > size-3) or (pos[1] > size-3))
-            self.reject_fn = reject_fn
+            self.reject_fn = outer_reject_fn
         else:
             self.reject_fn = None
         mission_space = MissionSpace(
@@ -116,6 +226,16 @@ class Crafting(SGMiniGridEnv):
         })
         self.observation_space = sg_observation_space
 
+        if compose:
+            self.completion_tasks = HL_TASKS + LL_TASKS
+        else:
+            self.completion_tasks = LL_TASKS
+        self.completion_ids = np.array([
+            self.completion_lookup.mission_to_id[self._gen_mission(task)]
+            for task in self.completion_tasks
+        ], dtype=np.int_)
+        self.completion_shifts = np.array([TASK_TO_ID[task] for task in self.completion_tasks], dtype=np.int64)
+
     @staticmethod
     def _gen_mission(target: str):
         # low level targets
@@ -136,7 +256,7 @@ class Crafting(SGMiniGridEnv):
         else:
             self.goal = pool[task_id % len(pool)]
 
-    def _gen_grid(self, width, height):
+    def _setup_task(self):
         self.task_infos = {}# Info about current task for logging
         self.task_infos['tags'] = []
 
@@ -146,38 +266,48 @@ class Crafting(SGMiniGridEnv):
         for i, sg in enumerate(SUBGOALS[self.goal]):
             self.sketch[i] = LL_TO_ID[sg] + 1
 
+        self.env_state = CraftState()
+        self.prev_state = self.env_state.bits
+        self.goal_bit = TASK_BITS[self.goal]
+        self.subgoal_reward_mask = SUBGOAL_REWARD_MASKS[self.goal]
+
+    def _setup_dist_bonus(self):
+        if self.dist_bonus:
+            self.prev_pos = np.array(self.agent_pos)
+        if self.dist_bonus and not self.compose:
+            self._update_dist_field()
+
+    def _gen_grid(self, width, height):
+        self._setup_task()
+
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = self._make_grid(width, height)
 
         # Generate the surrounding walls
         self.grid.wall_rect(0, 0, width, height)
 
-        self.env_state = {}
-        for t in LL_TASKS + HL_TASKS:
-            self.env_state[t] = False
-        self.prev_state = dict(self.env_state)
-
         # Generate objects and tools
-        if self.fixed_pos:
-            rng = np.random.default_rng(42)
-        else:
-            rng = None
+        objs = []
         for _ in range(self.num_trees):
             self.tree = Collectible('wood', 'red', self.env_state, self.grid, 0)
-            self.rng_place_obj(self.tree, rng=rng, reject_fn=self.reject_fn)
+            objs.append(self.tree)
         for _ in range(self.num_grass):
             self.grass = Collectible('grass', 'green', self.env_state, self.grid, 1)
-            self.rng_place_obj(self.grass, rng=rng, reject_fn=self.reject_fn)
+            objs.append(self.grass)
         for _ in range(self.num_iron):
             self.iron = Collectible('iron', 'blue', self.env_state, self.grid, 2)
-            self.rng_place_obj(self.iron, rng=rng, reject_fn=self.reject_fn)
+            objs.append(self.iron)
 
         self.toolshed = Interactable('toolshed', 'purple', self.env_state, 3)
-        self.rng_place_obj(self.toolshed, rng=rng, reject_fn=self.reject_fn)
         self.workbench = Interactable('workbench', 'yellow', self.env_state, 4)
-        self.rng_place_obj(self.workbench, rng=rng, reject_fn=self.reject_fn)
         self.factory = Interactable('factory', 'grey', self.env_state, 5)
-        self.rng_place_obj(self.factory, rng=rng, reject_fn=self.reject_fn)
+        objs += [self.toolshed, self.workbench, self.factory]
+
+        if self.fixed_pos:
+            for obj, pos in zip(objs, fixed_layout(self.size, len(objs), self.outer_place)):
+                self.put_obj(obj, *pos)
+        else:
+            self.place_objs(objs, reject_fn=self.reject_fn)
 
         self.all_tools = ['toolshed', 'workbench', 'factory']
         self.target_to_obj = {
@@ -196,8 +326,33 @@ class Crafting(SGMiniGridEnv):
             self.place_agent(top=(self.size//2 - 1, self.size//2 - 1), size=(2,2), rand_dir=True)
         else:
             self.place_agent()
-        if self.dist_bonus:
-            self.prev_pos = np.array(self.agent_pos)
+        self._setup_dist_bonus()
+
+    def _decode_obj(self, type_idx, color_idx, state):
+        # state of collectibles and interactables is their LL task id
+        if type_idx == NEW_OBJECT_TO_IDX['collectible']:
+            return Collectible(LL_TASKS[state], IDX_TO_COLOR[color_idx], self.env_state, self.grid, state)
+        if type_idx == NEW_OBJECT_TO_IDX['interactable']:
+            return Interactable(LL_TASKS[state], IDX_TO_COLOR[color_idx], self.env_state, state)
+        return super()._decode_obj(type_idx, color_idx, state)
+
+    def _load_layout(self, layout):
+        self.goal = self.place_holders[0][layout.mission_id]
+        self._setup_task()
+        super()._load_layout(layout)
+
+        self.all_tools = ['toolshed', 'workbench', 'factory']
+        self.target_to_obj = {
+            obj.name: obj for obj in self.grid.grid
+            if isinstance(obj, (Collectible, Interactable))
+        }
+        self.tree = self.target_to_obj['wood']
+        self.grass = self.target_to_obj['grass']
+        self.iron = self.target_to_obj['iron']
+        self.toolshed = self.target_to_obj['toolshed']
+        self.workbench = self.target_to_obj['workbench']
+        self.factory = self.target_to_obj['factory']
+        self._setup_dist_bonus()
 
     def rng_place_obj(
         self,
@@ -209,118 +364,70 @@ class Crafting(SGMiniGridEnv):
         rng=None,
     ):
         """
-        Modifies minigrid place_obj with rng arg (for fixed placements)
+        place_obj with rng arg (for fixed placements)
         """
-        if rng is None:
-            rng = self.np_random
-
-        if top is None:
-            top = (0, 0)
-        else:
-            top = (max(top[0], 0), max(top[1], 0))
-
-        if size is None:
-            size = (self.grid.width, self.grid.height)
-
-        num_tries = 0
-
-        while True:
-            # This is to handle with rare cases where rejection sampling
-            # gets stuck in an infinite loop
-            if num_tries > max_tries:
-                raise RecursionError("rejection sampling failed in place_obj")
-
-            num_tries += 1
-
-            pos = (
-                rng.integers(top[0], min(top[0] + size[0], self.grid.width)),
-                rng.integers(top[1], min(top[1] + size[1], self.grid.height)),
-            )
-
-            # Don't place the object on top of another object
-            if self.grid.get(*pos) is not None:
-                continue
+        return self.place_obj(obj, top, size, reject_fn, max_tries, rng=rng)
 
-            # Don't place the object where the agent is
-            if np.array_equal(pos, self.agent_pos):
-                continue
-
-            # Check if there is a filtering criterion
-            if reject_fn and reject_fn(self, pos):
-                continue
-
-            break
-
-        self.grid.set(pos[0], pos[1], obj)
-
-        if obj is not None:
-            obj.init_pos = pos
-            obj.cur_pos = pos
+    def _update_dist_field(self):
+        """
+        Manhattan distance from every cell to the nearest target of the goal,
+        recomputed only when a target is removed from the grid
+        """
+        target_enc = self.target_to_obj[self.goal].encode()
+        self.target_pos = np.array([
+            (i % self.grid.width, i // self.grid.width)
+            for i, obj in enumerate(self.grid.grid)
+            if obj is not None and obj.encode() == target_enc
+        ], dtype=np.int_).reshape(-1, 2)
+
+        self.dist_field = np.full((self.size, self.size), self.max_dist, dtype=np.int_)
+        if len(self.target_pos) > 0:
+            dist = np.abs(self.pos_grid[:, :, None] - self.target_pos).sum(axis=-1)
+            self.dist_field = dist.min(axis=-1)
+
+    def _target_dist(self, pos, agent_pos):
+        """Distance from pos to the nearest target, not counting the agent's cell"""
+        if self.dist_field[agent_pos[0], agent_pos[1]] > 0:
+            return self.dist_field[pos[0], pos[1]]
+
+        # agent is standing on a target
+        targets = self.target_pos[(self.target_pos != agent_pos).any(axis=-1)]
+        if len(targets) == 0:
+            return self.max_dist
+        return np.abs(targets - pos).sum(axis=-1).min()
+
+    def _get_extra_state(self):
+        dist = None
+        if self.dist_bonus:
+            dist = (self.prev_pos, getattr(self, 'cur_min_dist', None), getattr(self, 'target_pos', None), getattr(self, 'dist_field', None))
+        return (self.env_state.bits, self.prev_state, dist)
 
-        return pos
+    def _set_extra_state(self, extra):
+        self.env_state.bits, self.prev_state, dist = extra
+        if dist is not None:
+            self.prev_pos, self.cur_min_dist, self.target_pos, self.dist_field = dist
 
     def _update_state(self):
-        used_tool = {}
-        for tool in self.all_tools:
-            used_tool[tool] = not self.prev_state[tool] and self.env_state[tool]
-
-        if used_tool['toolshed']:
-            if self.env_state['wood']:
-                self.env_state['plank'] = True
-            if self.env_state['grass']:
-                self.env_state['rope'] = True
-            if self.env_state['stick'] and self.env_state['iron']:
-                self.env_state['axe'] = True
-        if used_tool['workbench']:
-            if self.env_state['wood']:
-                self.env_state['stick'] = True
-            if self.env_state['plank'] and self.env_state['grass']:
-                self.env_state['bed'] = True
-            if self.env_state['stick'] and self.env_state['iron']:
-                self.env_state['shears'] = True
-        if used_tool['factory']:
-            if self.env_state['grass']:
-                self.env_state['cloth'] = True
-            if self.env_state['iron'] and self.env_state['wood']:
-                self.env_state['bridge'] = True
-
-    def _subtask_completions(self):
-        completion = {}
-        if self.compose:
-            tasks = HL_TASKS + LL_TASKS
-        else:
-            tasks = LL_TASKS
-        for task in tasks:
-            completion[self._gen_mission(task)] = self.env_state[task]
-        return completion
+        self.env_state.craft(self.prev_state)
+
+    def _update_completions(self, completion):
+        completion[self.completion_ids] = (self.env_state.bits >> self.completion_shifts) & 1
     
     def _reward(self, obs):
         reward = 0
-        subgoals = SUBGOAL_REWARDS[self.goal]
-        obtained = {t for t in self.env_state if self.env_state[t] and not self.prev_state[t]}
-        for sg in subgoals:
-            if sg in obtained:
-                reward += SUBGOAL_BASE_REWARD * np.exp(-self.step_count / 20)
+        obtained = self.env_state.bits & ~self.prev_state
+        for _ in range(bin(obtained & self.subgoal_reward_mask).count('1')):
+            reward += SUBGOAL_BASE_REWARD * np.exp(-self.step_count / 20)
 
-        if self.goal in obtained:
+        if obtained & self.goal_bit:
             if self.compose:
                 reward += np.exp(-(self.step_count - 10) / 10)# penalize agent for using more than the minimal steps (~10)
             else:
                 reward += 1.0
         if self.dist_bonus and not self.compose:
-            target_enc = np.array(self.target_to_obj[self.goal].encode())
             pos = np.array(self.agent_pos)
-            grid = self.grid.encode()
-            grid[pos[0], pos[1]] = 0
-            target_mask = (grid == target_enc).all(axis=-1)
-
-            dist = np.abs(self.pos_grid - pos).sum(axis=-1)
-            dist[~target_mask] = self.max_dist
-            min_dist = dist.min()
-
-            prev_dist = np.abs(self.pos_grid - self.prev_pos).sum(axis=-1)
-            prev_dist[~target_mask] = self.max_dist
-            prev_min_dist = prev_dist.min()
+            min_dist = self._target_dist(pos, pos)
+            prev_min_dist = self._target_dist(self.prev_pos, pos)
 
             bonus = self.dist_bonus_scale * max(0, prev_min_dist - min_dist)
             reward += bonus
@@ -339,14 +446,19 @@ class Crafting(SGMiniGridEnv):
 
         obs['sketch'] = self.sketch
 
+        if self.dist_bonus and not self.compose and action == self.actions.toggle:
+            fwd_pos = self.front_pos
+            if self.dist_field[fwd_pos[0], fwd_pos[1]] == 0 and self.grid.get(*fwd_pos) is None:
+                # a target was collected
+                self._update_dist_field()
+
         self._update_state()
         reward = self._reward(obs)
 
-        terminated = self.env_state[self.goal]
+        terminated = bool(self.env_state.bits & self.goal_bit)
 
         # refresh tool usage
-        for tool in self.all_tools:
-            self.env_state[tool] = False
-        self.prev_state = dict(self.env_state)
+        self.env_state.bits &= ~TOOL_MASK
+        self.prev_state = self.env_state.bits
 
         return obs, reward, terminated, truncated, info
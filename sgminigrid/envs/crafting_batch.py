@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+from gymnasium.utils import seeding
+from minigrid.minigrid_env import MiniGridEnv
+from sgminigrid.envs.crafting import (
+    CRAFT_TABLE,
+    HL_TASKS,
+    LL_TASKS,
+    LL_TO_ID,
+    MAX_SUBGOAL,
+    SUBGOAL_BASE_REWARD,
+    SUBGOAL_REWARD_MASKS,
+    SUBGOAL_REWARDS,
+    SUBGOALS,
+    TASK_BITS,
+    TASK_TO_ID,
+    TASKS,
+    TOOL_MASK,
+    TOOL_SHIFT,
+    fixed_layout,
+)
+import numpy as np
+
+DIR_TO_VEC = np.array([
+    [1, 0],
+    [0, 1],
+    [-1, 0],
+    [0, -1],
+], dtype=np.int64)
+
+# Compact cell codes, identical to CompactCraftObsWrapper output
+EMPTY = 1
+WALL = 2
+AGENT = 3
+OBJ_OFFSET = 4# cell code of LL task t is OBJ_OFFSET + LL_TO_ID[t]
+N_COLLECTIBLES = 3# wood, grass, iron
+
+ACTIONS = MiniGridEnv.Actions
+
+
+class BatchCrafting(object):
+    """
+    Struct-of-arrays version of Crafting that steps N worlds at once.
+
+    Layouts, transitions, completions and rewards match N independent
+    Crafting envs seeded the same way. Observations are the compact
+    (W, H) images produced by CompactCraftObsWrapper, and the 'mission'
+    string is omitted.
+    """
+
+    def __init__(
+        self,
+        num_envs,
+        size=10,
+        max_steps: int | None = None,
+        compose=False,
+        dist_bonus=False,
+        fixed_pos=False,
+        outer_place=False,
+    ):
+        self.num_envs = num_envs
+        self.size = size
+        self.compose = compose
+        self.dist_bonus = dist_bonus
+        self.fixed_pos = fixed_pos
+        self.outer_place = outer_place
+        if max_steps is None:
+            max_steps = 10 * size
+        self.max_steps = max_steps
+
+        self.num_trees = 3
+        self.num_grass = 5
+        self.num_iron = 2
+        self.layout = [LL_TO_ID['wood']] * self.num_trees\
+            + [LL_TO_ID['grass']] * self.num_grass\
+            + [LL_TO_ID['iron']] * self.num_iron\
+            + [LL_TO_ID['toolshed'], LL_TO_ID['workbench'], LL_TO_ID['factory']]
+
+        self.pool = HL_TASKS if compose else LL_TASKS
+        n_goals = len(self.pool)
+        # per goal lookup tables
+        self.goal_bit = np.array([TASK_BITS[g] for g in self.pool], dtype=np.int64)
+        self.goal_sketch = np.zeros((n_goals, MAX_SUBGOAL), dtype=np.int_)
+        for i, g in enumerate(self.pool):
+            for j, sg in enumerate(SUBGOALS[g]):
+                self.goal_sketch[i, j] = LL_TO_ID[sg] + 1
+        self.goal_subgoal_reward_mask = np.array([SUBGOAL_REWARD_MASKS[g] for g in self.pool], dtype=np.int64)
+        self.max_subgoal_rewards = max(len(SUBGOAL_REWARDS[g]) for g in self.pool)
+        self.goal_target = np.array([TASK_TO_ID[g] for g in self.pool]) + OBJ_OFFSET# only meaningful for LL goals
+        completion_tasks = TASKS if compose else LL_TASKS
+        self.completion_mask = np.array([t in completion_tasks for t in TASKS], dtype=np.bool_)
+        self.task_shifts = np.arange(len(TASKS), dtype=np.int64)
+
+        # constants for calculating distance bonus
+        discount_factor = 0.95
+        self.dist_bonus_scale = (1 - discount_factor) / 2
+        self.max_dist = 2 * self.size
+        self.pos_grid = np.mgrid[:size, :size].transpose(1, 2, 0)
+
+        self._idx = np.arange(num_envs)
+        self._np_random = [None] * num_envs
+
+        self.cells = np.full((num_envs, size, size), EMPTY, dtype=np.uint8)
+        self.agent_pos = np.zeros((num_envs, 2), dtype=np.int64)
+        self.agent_dir = np.zeros(num_envs, dtype=np.int64)
+        self.goal = np.zeros(num_envs, dtype=np.int64)
+        self.step_count = np.zeros(num_envs, dtype=np.int64)
+        # bitmasks over TASKS, as in CraftState
+        self.env_state = np.zeros(num_envs, dtype=np.int64)
+        self.prev_state = np.zeros(num_envs, dtype=np.int64)
+        self.prev_pos = np.zeros((num_envs, 2), dtype=np.int64)
+        self.cur_min_dist = np.zeros(num_envs, dtype=np.int64)
+
+    def np_random(self, i):
+        if self._np_random[i] is None:
+            self._np_random[i], _ = seeding.np_random()
+        return self._np_random[i]
+
+    def reset(self, seed=None, options=None, mask=None):
+        """
+        Reset all envs, or only those selected by the boolean `mask`.
+        `seed` is an int (env i gets seed + i) or a sequence of per-env seeds.
+        `options` may hold 'task_id', an int or a sequence of per-env ids.
+        """
+        options = {} if options is None else options
+        task_id = options.get('task_id', None)
+        idx = self._idx if mask is None else self._idx[np.asarray(mask)]
+        for i in idx:
+            if seed is None:
+                env_seed = None
+            elif np.isscalar(seed):
+                env_seed = int(seed + i)
+            else:
+                env_seed = int(seed[i])
+            env_task = task_id if task_id is None or np.isscalar(task_id) else task_id[i]
+            self._reset_env(i, env_seed, env_task)
+        return self._obs(self._completion()), {}
+
+    def _reset_env(self, i, seed, task_id):
+        # task is sampled before reseeding, as in SGMiniGridEnv.reset
+        if task_id is None:
+            self.goal[i] = self.np_random(i).integers(0, len(self.pool))
+        else:
+            self.goal[i] = task_id % len(self.pool)
+        if seed is not None:
+            self._np_random[i], _ = seeding.np_random(seed)
+        np_random = self.np_random(i)
+
+        size = self.size
+        cells = self.cells[i]
+        cells[:] = EMPTY
+        cells[0, :] = WALL
+        cells[-1, :] = WALL
+        cells[:, 0] = WALL
+        cells[:, -1] = WALL
+
+        if self.fixed_pos:
+            positions = np.array(fixed_layout(size, len(self.layout), self.outer_place))
+        else:
+            free = self._free_cells(cells, reject=self.outer_place)
+            positions = free[np_random.permutation(len(free))[:len(self.layout)]]
+        cells[positions[:, 0], positions[:, 1]] = OBJ_OFFSET + np.array(self.layout)
+
+        if self.outer_place and self.compose:
+            top = (size//2 - 1, size//2 - 1)
+            extent = (2, 2)
+        else:
+            top = (0, 0)
+            extent = (size, size)
+        free = self._free_cells(cells, top=top, extent=extent)
+        self.agent_pos[i] = free[np_random.integers(len(free))]
+        self.agent_dir[i] = np_random.integers(0, 4)
+
+        self.step_count[i] = 0
+        self.env_state[i] = 0
+        self.prev_state[i] = 0
+        self.prev_pos[i] = self.agent_pos[i]
+
+    def _free_cells(self, cells, top=(0, 0), extent=None, reject=False):
+        """
+        Empty cells in the same order as SGMiniGridEnv._free_cells
+        """
+        size = self.size
+        if extent is None:
+            extent = (size, size)
+        eligible = np.zeros((size, size), dtype=np.bool_)
+        eligible[top[0]:top[0] + extent[0], top[1]:top[1] + extent[1]] = True
+        eligible &= cells == EMPTY
+        if reject:
+            eligible[2:size-2, 2:size-2] = False
+        return np.argwhere(eligible)
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        if ((actions < 0) | (actions >= len(ACTIONS))).any():
+            raise ValueError(f"Unknown action: {actions}")
+        idx = self._idx
+        self.step_count += 1
+
+        fwd_pos = self.agent_pos + DIR_TO_VEC[self.agent_dir]
+        fwd_cell = self.cells[idx, fwd_pos[:, 0], fwd_pos[:, 1]]
+
+        self.agent_dir = np.where(actions == ACTIONS.left, (self.agent_dir - 1) % 4, self.agent_dir)
+        self.agent_dir = np.where(actions == ACTIONS.right, (self.agent_dir + 1) % 4, self.agent_dir)
+
+        # every non wall object can be overlapped
+        move = (actions == ACTIONS.forward) & (fwd_cell != WALL)
+        self.agent_pos[move] = fwd_pos[move]
+
+        toggled = (actions == ACTIONS.toggle) & (fwd_cell >= OBJ_OFFSET)
+        tidx = idx[toggled]
+        obj = fwd_cell[toggled].astype(np.int64) - OBJ_OFFSET
+        self.env_state[tidx] |= 1 << obj# LL task ids are the object ids
+        collected = obj < N_COLLECTIBLES
+        cpos = fwd_pos[toggled][collected]
+        self.cells[tidx[collected], cpos[:, 0], cpos[:, 1]] = EMPTY
+
+        # completions are read before crafting, as in SGMiniGridEnv.step
+        obs = self._obs(self._completion())
+
+        self._update_state()
+        reward = self._reward()
+
+        terminated = (self.env_state & self.goal_bit[self.goal]) != 0
+        truncated = self.step_count >= self.max_steps
+
+        # refresh tool usage
+        self.env_state &= ~TOOL_MASK
+        self.prev_state = self.env_state.copy()
+
+        return obs, reward, terminated, truncated, {}
+
+    def _update_state(self):
+        used = ((self.env_state & ~self.prev_state) & TOOL_MASK) >> TOOL_SHIFT
+        self.env_state |= CRAFT_TABLE[used, self.env_state]
+
+    def _reward(self):
+        idx = self._idx
+        obtained = self.env_state & ~self.prev_state
+        reward = np.zeros(self.num_envs, dtype=np.float64)
+
+        # add terms one at a time to match the float summation order of Crafting._reward
+        sg_reward = SUBGOAL_BASE_REWARD * np.exp(-self.step_count / 20)
+        sg_obtained = obtained & self.goal_subgoal_reward_mask[self.goal]
+        n_obtained = ((sg_obtained[:, None] >> self.task_shifts) & 1).sum(axis=-1)
+        for j in range(self.max_subgoal_rewards):
+            reward = np.where(n_obtained > j, reward + sg_reward, reward)
+
+        done = (obtained & self.goal_bit[self.goal]) != 0
+        if self.compose:
+            goal_reward = np.exp(-(self.step_count - 10) / 10)# penalize agent for using more than the minimal steps (~10)
+        else:
+            goal_reward = 1.0
+        reward = np.where(done, reward + goal_reward, reward)
+
+        if self.dist_bonus and not self.compose:
+            pos = self.agent_pos.copy()
+            target_mask = self.cells == self.goal_target[self.goal][:, None, None]
+            target_mask[idx, pos[:, 0], pos[:, 1]] = False
+
+            min_dist = self._min_dist(pos, target_mask)
+            prev_min_dist = self._min_dist(self.prev_pos, target_mask)
+
+            bonus = self.dist_bonus_scale * np.maximum(0, prev_min_dist - min_dist)
+            reward = reward + bonus
+            self.cur_min_dist = min_dist
+
+            self.prev_pos = pos
+        return reward
+
+    def _min_dist(self, pos, target_mask):
+        dist = np.abs(self.pos_grid[None] - pos[:, None, None]).sum(axis=-1)
+        dist[~target_mask] = self.max_dist
+        return dist.reshape(self.num_envs, -1).min(axis=-1)
+
+    def _completion(self):
+        return (((self.env_state[:, None] >> self.task_shifts) & 1) != 0) & self.completion_mask
+
+    def _obs(self, completion):
+        image = self.cells.copy()
+        image[self._idx, self.agent_pos[:, 0], self.agent_pos[:, 1]] = AGENT
+        return {
+            'image': image,
+            'direction': self.agent_dir.copy(),
+            'mission_id': self.goal.copy(),
+            'completion': completion,
+            'sketch': self.goal_sketch[self.goal],
+        }
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 from minigrid.core.constants import COLOR_NAMES
-from minigrid.core.grid import Grid
 from minigrid.core.mission import MissionSpace
 from minigrid.core.world_object import Door, Goal, Key
 from sgminigrid.sgminigrid_env import SGMiniGridEnv
@@ -43,7 +42,7 @@ class SGEmptyEnv(SGMiniGridEnv):
 
     def _gen_grid(self, width, height):
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = self._make_grid(width, height)
 
         # Generate the surrounding walls
         self.grid.wall_rect(0, 0, width, height)
@@ -63,10 +62,8 @@ class SGEmptyEnv(SGMiniGridEnv):
 
         self.mission = "get to the green goal square"
 
-    def _subtask_completions(self):
-        completion = {}
-        completion[self._gen_mission()] = self.agent_pos == self.goal_pos
-        return completion
+    def _update_completions(self, completion):
+        completion[0] = self.agent_pos == self.goal_pos
 
     def step(self, action):
         obs, reward, terminated, truncated, info = super().step(action)
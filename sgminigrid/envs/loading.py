@@ -1,8 +1,6 @@
 from __future__ import annotations
-import types
 
 from minigrid.core.constants import COLOR_NAMES
-from minigrid.core.grid import Grid
 from minigrid.core.mission import MissionSpace
 from minigrid.core.world_object import Door, Goal, Key, Ball, Wall
 from sgminigrid.sgminigrid_env import SGMiniGridEnv
@@ -10,7 +8,15 @@ from sgminigrid.sgworld_object import Button, ButtonDoor
 import numpy as np
 
 
+class StickyBall(Ball):
+    """Ball that can't be picked up again once loaded"""
+    def can_pickup(self):
+        return self.cur_pos[0] > 2
+
+
 class SGLoading(SGMiniGridEnv):
+    PICKLE_SKIP = SGMiniGridEnv.PICKLE_SKIP + ('completion_ids',)
+
     def __init__(
         self,
         size=7,
@@ -53,6 +59,10 @@ class SGLoading(SGMiniGridEnv):
             max_steps=max_steps,
             **kwargs,
         )
+        self.completion_ids = {
+            goal: self.completion_lookup.mission_to_id[self._gen_mission(goal)]
+            for goal in place_holders[0]
+        }
 
     @staticmethod
     def _gen_mission(color: str):
@@ -91,7 +101,7 @@ class SGLoading(SGMiniGridEnv):
         self.mission = self._gen_mission(goal)
 
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = self._make_grid(width, height)
 
         # Generate the surrounding walls
         self.grid.wall_rect(0, 0, width, height)
@@ -99,44 +109,42 @@ class SGLoading(SGMiniGridEnv):
         self.put_obj(Wall(), 2, 1)
 
 
-        self.red = Ball('red')
+        ball = StickyBall if self.sticky else Ball
+        self.red = ball('red')
         if pre_place_red:
             self.put_obj(self.red, self._rand_int(1, 3), 2)
         else:
             self.put_obj(self.red, 4, 1)
 
-        self.blue = Ball('blue')
+        self.blue = ball('blue')
         if pre_place_blue:
             self.put_obj(self.blue, self._rand_int(1, 3), 2)
         else:
             self.put_obj(self.blue, 5, 1)
 
-        if self.sticky:
-            self.red.can_pickup = types.MethodType(lambda self: self.cur_pos[0] > 2, self.red)
-            self.blue.can_pickup = types.MethodType(lambda self: self.cur_pos[0] > 2, self.blue)
-
         # Place the agent
         self.agent_pos = (self._rand_int(3, width-2), 2)
         self.agent_dir = 2
 
-        self.red_goal = lambda: (0 <= self.red.cur_pos[0] <= 2)
-        self.blue_goal = lambda: (0 <= self.blue.cur_pos[0] <= 2)
+    def red_goal(self):
+        return 0 <= self.red.cur_pos[0] <= 2
+
+    def blue_goal(self):
+        return 0 <= self.blue.cur_pos[0] <= 2
 
-        if goal == 'red':
-            self.goal_func = self.red_goal
-        elif goal == 'blue':
-            self.goal_func = self.blue_goal
-        elif goal == 'both':
-            self.goal_func = lambda: self.red_goal() and self.blue_goal()
+    def goal_func(self):
+        if self.goal == 'red':
+            return self.red_goal()
+        elif self.goal == 'blue':
+            return self.blue_goal()
+        return self.red_goal() and self.blue_goal()
 
-    def _subtask_completions(self):
-        completion = {}
+    def _update_completions(self, completion):
         if self.compose:
-            completion[self._gen_mission('both')] = self.red_goal() and self.blue_goal()
+            completion[self.completion_ids['both']] = self.red_goal() and self.blue_goal()
         else:
-            completion[self._gen_mission('red')] = self.red_goal()
-            completion[self._gen_mission('blue')] = self.blue_goal()
-        return completion
+            completion[self.completion_ids['red']] = self.red_goal()
+            completion[self.completion_ids['blue']] = self.blue_goal()
 
     def step(self, action):
         obs, reward, terminated, truncated, info = super().step(action)
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 from minigrid.core.constants import COLOR_NAMES
-from minigrid.core.grid import Grid
 from minigrid.core.mission import MissionSpace
 from minigrid.core.world_object import Door, Goal, Key
 from sgminigrid.sgminigrid_env import SGMiniGridEnv
@@ -10,6 +9,8 @@ import numpy as np
 
 
 class SGTunnel(SGMiniGridEnv):
+    PICKLE_SKIP = SGMiniGridEnv.PICKLE_SKIP + ('completion_ids',)
+
     def __init__(
         self,
         size=10,
@@ -48,6 +49,10 @@ class SGTunnel(SGMiniGridEnv):
             max_steps=max_steps,
             **kwargs,
         )
+        self.completion_ids = {
+            goal: self.completion_lookup.mission_to_id[self._gen_mission(goal)]
+            for goal in place_holders[0]
+        }
 
     @staticmethod
     def _gen_mission(color: str):
@@ -71,7 +76,7 @@ class SGTunnel(SGMiniGridEnv):
         self.task_infos['tags'] = []
 
         # Create an empty grid
-        self.grid = Grid(width, height)
+        self.grid = self._make_grid(width, height)
 
         # Generate the surrounding walls
         self.grid.wall_rect(0, 0, width, height)
@@ -93,21 +98,19 @@ class SGTunnel(SGMiniGridEnv):
         self.task_infos['tags'].append(goal)
         self.mission = self._gen_mission(goal)
 
-        if goal == 'red':
-            self.goal_func = lambda: self.red.is_pressed
-        elif goal == 'blue':
-            self.goal_func = lambda: self.blue1.is_pressed or self.blue2.is_pressed
-        elif goal == 'both':
-            self.goal_func = lambda: self.red.is_pressed and (self.blue1.is_pressed or self.blue2.is_pressed)
+    def goal_func(self):
+        if self.goal == 'red':
+            return self.red.is_pressed
+        elif self.goal == 'blue':
+            return self.blue1.is_pressed or self.blue2.is_pressed
+        return self.red.is_pressed and (self.blue1.is_pressed or self.blue2.is_pressed)
 
-    def _subtask_completions(self):
-        completion = {}
+    def _update_completions(self, completion):
         if self.compose:
-            completion[self._gen_mission('both')] = self.red.is_pressed and (self.blue1.is_pressed or self.blue2.is_pressed)
+            completion[self.completion_ids['both']] = self.red.is_pressed and (self.blue1.is_pressed or self.blue2.is_pressed)
         else:
-            completion[self._gen_mission('red')] = self.red.is_pressed
-            completion[self._gen_mission('blue')] = self.blue1.is_pressed or self.blue2.is_pressed
-        return completion
+            completion[self.completion_ids['red']] = self.red.is_pressed
+            completion[self.completion_ids['blue']] = self.blue1.is_pressed or self.blue2.is_pressed
 
     def step(self, action):
         obs, reward, terminated, truncated, info = super().step(action)
@@ -0,0 +1,167 @@
+"""
+Pre-generated episode layouts stored as memory-mapped arrays.
+
+A bank directory holds one .npy file per field plus meta.json. Entry i is
+the layout SGMiniGridEnv.reset(seed=base_seed + i) produces when the env
+RNG is seeded with the same seed beforehand, so entries do not depend on
+how generation was split across workers. Only envs that set
+SUPPORTS_LAYOUT_BANK (Crafting and the ButtonDoor envs) can be banked.
+
+Usage:
+    python -m sgminigrid.layout_bank SGMG-Crafting-v0 SGMG-BDoor-v0 banks/ -n 1000000 -j 8
+    env = gym.make('SGMG-Crafting-v0', layout_bank='banks/SGMG-Crafting-v0')
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+from collections import namedtuple
+
+import numpy as np
+
+MAX_TAGS = 4
+FIELDS = ('cells', 'agent', 'mission_id', 'tags')
+
+Layout = namedtuple('Layout', ['cells', 'agent_pos', 'agent_dir', 'mission_id', 'tags'])
+
+
+class LayoutBank(object):
+    """
+    Read-only view of a bank directory. Arrays are opened with
+    mmap_mode='r', so processes sharing a bank share its pages.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.env_id = self.meta['env_id']
+        self.base_seed = self.meta['base_seed']
+        self.tag_vocab = self.meta['tags']
+        for name in FIELDS:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+        self._mission_index = {}
+
+    def __reduce__(self):
+        # reopened from its directory rather than copying the arrays
+        return (LayoutBank, (self.path,))
+
+    def __len__(self):
+        return self.cells.shape[0]
+
+    def __getitem__(self, i):
+        agent = self.agent[i]
+        return Layout(
+            cells=np.asarray(self.cells[i]),
+            agent_pos=(int(agent[0]), int(agent[1])),
+            agent_dir=int(agent[2]),
+            mission_id=int(self.mission_id[i]),
+            tags=[self.tag_vocab[t] for t in self.tags[i] if t >= 0],
+        )
+
+    def mission_index(self, mission_id):
+        """Indices of entries with the given mission id"""
+        if mission_id not in self._mission_index:
+            self._mission_index[mission_id] = np.flatnonzero(np.asarray(self.mission_id) == mission_id)
+        return self._mission_index[mission_id]
+
+    def sample_index(self, rng, seed=None, task_id=None):
+        """
+        Entry for a reset: the one generated from `seed` (wrapping around
+        the bank), a random entry with mission `task_id`, or a random entry
+        """
+        if task_id is not None:
+            candidates = self.mission_index(task_id)
+            if len(candidates) == 0:
+                raise ValueError(f"no layout with mission id {task_id} in {self.path}")
+            return int(candidates[rng.integers(len(candidates))])
+        if seed is not None:
+            return (seed - self.base_seed) % len(self)
+        return int(rng.integers(len(self)))
+
+
+def _fill(path, env_id, env_kwargs, base_seed, start, stop):
+    """Generate entries [start, stop) into the bank arrays, returning the local tag vocabulary"""
+    import gymnasium as gym
+
+    env = gym.make(env_id, **env_kwargs).unwrapped
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r+') for name in FIELDS}
+    vocab = {}
+    for i in range(start, stop):
+        seed = base_seed + i
+        env.np_random = np.random.Generator(np.random.PCG64(seed))
+        env.reset(seed=seed)
+        layout = env.get_layout()
+        arrays['cells'][i] = layout.cells
+        arrays['agent'][i] = (*layout.agent_pos, layout.agent_dir)
+        arrays['mission_id'][i] = layout.mission_id
+        arrays['tags'][i] = -1
+        for j, tag in enumerate(layout.tags[:MAX_TAGS]):
+            arrays['tags'][i, j] = vocab.setdefault(tag, len(vocab))
+    for a in arrays.values():
+        a.flush()
+    return start, stop, list(vocab)
+
+
+def generate_bank(env_id, path, n, base_seed=0, workers=1, env_kwargs=None, chunk_size=10000):
+    """
+    Generate n layouts of env_id into the directory `path`
+    """
+    import gymnasium as gym
+
+    env_kwargs = {} if env_kwargs is None else env_kwargs
+    env = gym.make(env_id, **env_kwargs).unwrapped
+    if not getattr(env, 'SUPPORTS_LAYOUT_BANK', False):
+        raise ValueError(f"{env_id} does not support layout banks")
+    os.makedirs(path, exist_ok=True)
+    shapes = {
+        'cells': ((n, env.width, env.height, 3), np.uint8),
+        'agent': ((n, 3), np.int16),
+        'mission_id': ((n,), np.int16),
+        'tags': ((n, MAX_TAGS), np.int16),
+    }
+    for name, (shape, dtype) in shapes.items():
+        np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape).flush()
+
+    chunks = [(path, env_id, env_kwargs, base_seed, s, min(s + chunk_size, n)) for s in range(0, n, chunk_size)]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.starmap(_fill, chunks)
+    else:
+        results = [_fill(*chunk) for chunk in chunks]
+
+    # merge the per chunk tag vocabularies
+    vocab = {}
+    tags = np.load(os.path.join(path, 'tags.npy'), mmap_mode='r+')
+    for start, stop, local in results:
+        remap = np.array([vocab.setdefault(tag, len(vocab)) for tag in local] + [-1], dtype=np.int16)
+        tags[start:stop] = remap[tags[start:stop]]# -1 padding maps to the last entry
+    tags.flush()
+
+    meta = {
+        'env_id': env_id,
+        'env_kwargs': env_kwargs,
+        'base_seed': base_seed,
+        'size': n,
+        'tags': list(vocab),
+    }
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return LayoutBank(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="pre-generate layout banks for SGMG-* envs")
+    parser.add_argument("envs", nargs='+', help="env ids")
+    parser.add_argument("out", help="output directory, one bank per env id")
+    parser.add_argument("-n", "--num", type=int, default=100000, help="layouts per env")
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first layout")
+    parser.add_argument("--env-kwargs", type=json.loads, default={}, help="json dict passed to gym.make")
+    args = parser.parse_args()
+
+    for env_id in args.envs:
+        bank = generate_bank(env_id, os.path.join(args.out, env_id), args.num, args.seed, args.workers, args.env_kwargs)
+        print(f"{env_id}: {len(bank)} layouts in {bank.path}")
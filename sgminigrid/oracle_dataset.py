@@ -0,0 +1,233 @@
+"""
+Oracle demonstrations for the crafting envs, written as compressed shards.
+
+Shard k holds episodes [k * episodes_per_shard, (k + 1) * episodes_per_shard),
+episode e being played from reset(seed=base_seed + e). Shards are written
+to a temporary file and renamed when complete, and index.json lists the
+finished ones, so an interrupted run resumes by generating the missing
+shards.
+
+Usage:
+    python -m sgminigrid.oracle_dataset SGMG-Crafting-v1 data/crafting -n 1000000 -j 8
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+INDEX = 'index.json'
+
+# per step arrays of a shard and their dtypes
+STEP_FIELDS = {
+    'image': np.uint8,
+    'direction': np.int8,
+    'mission_id': np.int16,
+    'completion': np.bool_,
+    'sketch': np.int8,
+    'action': np.int8,
+    'reward': np.float32,
+    'terminated': np.bool_,
+    'truncated': np.bool_,
+}
+
+
+def shard_name(k):
+    return f'shard_{k:06d}.npz'
+
+
+class _ShardBuffer(object):
+    """Growable per field arrays for one shard"""
+    def __init__(self, capacity=4096):
+        self.size = 0
+        self.arrays = None
+        self.capacity = capacity
+        self.episode_start = [0]
+
+    def append(self, obs, action, reward, terminated, truncated):
+        row = {
+            'image': obs['image'],
+            'direction': obs['direction'],
+            'mission_id': obs['mission_id'],
+            'completion': obs['completion'],
+            'sketch': obs['sketch'],
+            'action': action,
+            'reward': reward,
+            'terminated': terminated,
+            'truncated': truncated,
+        }
+        if self.arrays is None:
+            self.arrays = {
+                k: np.zeros((self.capacity, *np.shape(v)), dtype=STEP_FIELDS[k])
+                for k, v in row.items()
+            }
+        elif self.size == self.capacity:
+            self.capacity *= 2
+            for k, a in self.arrays.items():
+                grown = np.zeros((self.capacity, *a.shape[1:]), dtype=a.dtype)
+                grown[:self.size] = a[:self.size]
+                self.arrays[k] = grown
+        for k, v in row.items():
+            self.arrays[k][self.size] = v
+        self.size += 1
+
+    def end_episode(self):
+        self.episode_start.append(self.size)
+
+    def save(self, path):
+        tmp = path + '.tmp.npz'
+        arrays = {k: a[:self.size] for k, a in self.arrays.items()}
+        np.savez_compressed(tmp, episode_start=np.array(self.episode_start, dtype=np.int64), **arrays)
+        os.replace(tmp, path)
+
+
+_worker_state = {}
+
+
+def _make_agent(env_id, nth_order):
+    import gymnasium as gym
+    from sgminigrid.crafting_oracle import CraftingOracleAgent, HLCraftingOracleAgent
+    from sgminigrid.wrappers import CompactCraftObsWrapper
+
+    env = CompactCraftObsWrapper(gym.make(env_id, full_obs=True))
+    if env.unwrapped.compose:
+        agent = HLCraftingOracleAgent(None, env, np.random.default_rng(42), nth_order=nth_order)
+    else:
+        agent = CraftingOracleAgent(None, env, np.random.default_rng(42), nth_order=nth_order)
+    return env, agent.get_test_actor()
+
+
+def _write_shard(path, env_id, k, episodes_per_shard, base_seed, nth_order, init_noise):
+    """Play the episodes of shard k and save it, returning its index entry"""
+    key = (env_id, nth_order)
+    if key not in _worker_state:
+        _worker_state.clear()
+        _worker_state[key] = _make_agent(env_id, nth_order)
+    env, actor = _worker_state[key]
+
+    buffer = _ShardBuffer()
+    first = k * episodes_per_shard
+    for e in range(first, first + episodes_per_shard):
+        seed = base_seed + e
+        env.unwrapped.np_random = np.random.Generator(np.random.PCG64(seed))
+        noise_rng = np.random.default_rng(seed)
+        obs, info = env.reset(seed=seed)
+        actor.observe_first(obs, info)
+        t = 0
+        while True:
+            t += 1
+            if t <= init_noise:
+                action = int(noise_rng.integers(env.action_space.n))
+            else:
+                action = int(actor.act())
+            next_obs, reward, terminated, truncated, info = env.step(action)
+            buffer.append(obs, action, reward, terminated, truncated)
+            if terminated or truncated:
+                break
+            actor.observe(next_obs, action, info)
+            obs = next_obs
+        buffer.end_episode()
+
+    buffer.save(os.path.join(path, shard_name(k)))
+    return {'file': shard_name(k), 'shard': k, 'first_episode': first, 'episodes': episodes_per_shard, 'steps': buffer.size}
+
+
+def _save_index(path, index):
+    tmp = os.path.join(path, INDEX + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, os.path.join(path, INDEX))
+
+
+def load_index(path):
+    with open(os.path.join(path, INDEX)) as f:
+        return json.load(f)
+
+
+def generate(env_id, path, episodes, episodes_per_shard=1000, base_seed=0, workers=1, nth_order=1, init_noise=0):
+    """
+    Generate `episodes` oracle episodes of env_id, rounded up to whole
+    shards, into `path`, skipping shards that an earlier run finished
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {
+        'env_id': env_id,
+        'base_seed': base_seed,
+        'episodes_per_shard': episodes_per_shard,
+        'nth_order': nth_order,
+        'init_noise': init_noise,
+    }
+    if os.path.exists(os.path.join(path, INDEX)):
+        index = load_index(path)
+        if index['meta'] != meta:
+            raise ValueError(f"{path} was generated with different settings: {index['meta']}")
+    else:
+        index = {'meta': meta, 'shards': []}
+    done = {entry['shard'] for entry in index['shards']}
+
+    # shards renamed into place after the last index update
+    for k in range(-(-episodes // episodes_per_shard)):
+        file = os.path.join(path, shard_name(k))
+        if k not in done and os.path.exists(file):
+            with np.load(file) as shard:
+                starts = shard['episode_start']
+            index['shards'].append({'file': shard_name(k), 'shard': k, 'first_episode': k * episodes_per_shard, 'episodes': len(starts) - 1, 'steps': int(starts[-1])})
+            done.add(k)
+
+    todo = [
+        (path, env_id, k, episodes_per_shard, base_seed, nth_order, init_noise)
+        for k in range(-(-episodes // episodes_per_shard)) if k not in done
+    ]
+    if workers > 1:
+        # on error the with block terminates the workers
+        with multiprocessing.Pool(workers) as pool:
+            _add_shards(path, index, pool.imap_unordered(_star_write_shard, todo))
+            pool.close()
+            pool.join()
+    else:
+        _add_shards(path, index, map(_star_write_shard, todo))
+    _save_index(path, index)
+    return index
+
+
+def _add_shards(path, index, entries):
+    """Record shards in the index as they complete, so an interrupted run can resume"""
+    for entry in entries:
+        index['shards'].append(entry)
+        index['shards'].sort(key=lambda entry: entry['shard'])
+        _save_index(path, index)
+
+
+def _star_write_shard(args):
+    return _write_shard(*args)
+
+
+def iter_episodes(path):
+    """Yield every episode of a dataset as a dict of arrays"""
+    for entry in load_index(path)['shards']:
+        with np.load(os.path.join(path, entry['file'])) as shard:
+            arrays = {k: shard[k] for k in STEP_FIELDS}
+            starts = shard['episode_start']
+        for s, e in zip(starts[:-1], starts[1:]):
+            yield {k: a[s:e] for k, a in arrays.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="generate crafting oracle demonstrations")
+    parser.add_argument("env", help="SGMG-Crafting-* env id")
+    parser.add_argument("out", help="output directory")
+    parser.add_argument("-n", "--episodes", type=int, default=10000)
+    parser.add_argument("--shard-episodes", type=int, default=1000, help="episodes per shard")
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    parser.add_argument("--orders", type=int, default=1, help="nth order agent")
+    parser.add_argument("--init-noise", type=int, default=0, help="randomly execute actions for first n timesteps")
+    args = parser.parse_args()
+
+    index = generate(args.env, args.out, args.episodes, args.shard_episodes, args.seed, args.workers, args.orders, args.init_noise)
+    n_steps = sum(entry['steps'] for entry in index['shards'])
+    print(f"{len(index['shards'])} shards, {n_steps} steps in {args.out}")
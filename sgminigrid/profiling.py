@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+
+from gymnasium import Wrapper
+
+
+class PhaseTimer(object):
+    """
+    Cumulative wall time and call counts per named phase. Phases nest, so
+    e.g. 'step' includes 'step.minigrid' which includes 'gen_obs'.
+    """
+    def __init__(self):
+        self.time = {}
+        self.calls = {}
+
+    def add(self, phase, dt):
+        self.time[phase] = self.time.get(phase, 0.0) + dt
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def wrap(self, obj, name, phase):
+        """Time every call to obj.name by shadowing it with an instance attribute"""
+        setattr(obj, name, TimedCall(self, phase, getattr(obj, name)))
+
+    @staticmethod
+    def unwrap(obj, name):
+        if isinstance(obj.__dict__.get(name, None), TimedCall):
+            delattr(obj, name)
+
+    def clear(self):
+        self.time.clear()
+        self.calls.clear()
+
+    def stats(self):
+        return {
+            phase: {
+                'calls': self.calls[phase],
+                'total_s': t,
+                'mean_us': t / self.calls[phase] * 1e6,
+            }
+            for phase, t in self.time.items()
+        }
+
+
+class TimedCall(object):
+    __slots__ = ('timer', 'phase', 'fn')
+
+    def __init__(self, timer, phase, fn):
+        self.timer = timer
+        self.phase = phase
+        self.fn = fn
+
+    def __call__(self, *args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            self.timer.add(self.phase, time.perf_counter() - t)
+
+
+def enable_profiling(env, info=False):
+    """
+    Enable phase timing on the SGMG env under `env` and time step/reset
+    of every wrapper around it, returning the shared PhaseTimer
+    """
+    timer = env.unwrapped.enable_profiling(info=info)
+    while isinstance(env, Wrapper):
+        name = type(env).__name__
+        timer.wrap(env, 'step', name + '.step')
+        timer.wrap(env, 'reset', name + '.reset')
+        env = env.env
+    return timer
+
+
+def disable_profiling(env):
+    env.unwrapped.disable_profiling()
+    while isinstance(env, Wrapper):
+        PhaseTimer.unwrap(env, 'step')
+        PhaseTimer.unwrap(env, 'reset')
+        env = env.env
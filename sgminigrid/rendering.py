@@ -0,0 +1,325 @@
+"""
+Cached tile rendering for SGMG grids.
+
+Tiles are drawn exactly as minigrid's Grid.render_tile draws them, but are
+cached in a bounded LRU keyed by the object's tile_key (which includes e.g.
+the button color of a ButtonDoor, missing from minigrid's encode based key).
+"""
+from __future__ import annotations
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+from minigrid.core.constants import COLOR_TO_IDX, OBJECT_TO_IDX, TILE_PIXELS
+from minigrid.core.world_object import WorldObj
+from minigrid.utils.rendering import (
+    downsample,
+    fill_coords,
+    highlight_img,
+    point_in_rect,
+    point_in_triangle,
+    rotate_fn,
+)
+from sgminigrid.sgworld_object import (
+    NEW_OBJECT_TO_IDX,
+    Button,
+    ButtonDoor,
+    Collectible,
+    Interactable,
+)
+
+
+def tile_key(obj):
+    """Everything the look of obj depends on"""
+    if obj is None:
+        return None
+    tile_key = getattr(obj, 'tile_key', None)
+    if tile_key is not None:
+        return tile_key()
+    return obj.encode()
+
+
+def draw_tile(obj, agent_dir=None, highlight=False, tile_size=TILE_PIXELS, subdivs=3):
+    """Rasterise one tile, same pixels as Grid.render_tile"""
+    img = np.zeros(shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8)
+
+    # Draw the grid lines (top and left edges)
+    fill_coords(img, point_in_rect(0, 0.031, 0, 1), (100, 100, 100))
+    fill_coords(img, point_in_rect(0, 1, 0, 0.031), (100, 100, 100))
+
+    if obj is not None:
+        obj.render(img)
+
+    # Overlay the agent on top
+    if agent_dir is not None:
+        tri_fn = point_in_triangle(
+            (0.12, 0.19),
+            (0.87, 0.50),
+            (0.12, 0.81),
+        )
+        tri_fn = rotate_fn(tri_fn, cx=0.5, cy=0.5, theta=0.5 * math.pi * agent_dir)
+        fill_coords(img, tri_fn, (255, 0, 0))
+
+    if highlight:
+        highlight_img(img)
+
+    return downsample(img, subdivs)
+
+
+class TileCache(object):
+    """
+    LRU cache of rendered tiles, holding at most max_size tiles. Cached
+    tiles are read-only and shared, copy before drawing on them.
+    """
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render_tile(self, obj, agent_dir=None, highlight=False, tile_size=TILE_PIXELS, subdivs=3):
+        key = (tile_key(obj), agent_dir, bool(highlight), tile_size, subdivs)
+        tile = self.tiles.get(key, None)
+        if tile is not None:
+            self.hits += 1
+            self.tiles.move_to_end(key)
+            return tile
+
+        self.misses += 1
+        tile = draw_tile(obj, agent_dir, highlight, tile_size, subdivs)
+        tile.flags.writeable = False
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_size:
+            self.tiles.popitem(last=False)
+            self.evictions += 1
+        return tile
+
+    def clear(self):
+        self.tiles.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.tiles),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# shared by all envs of a process, like minigrid's Grid.tile_cache
+TILE_CACHE = TileCache()
+
+
+def render_grid(grid, tile_size, agent_pos, agent_dir=None, highlight_mask=None, cache=None):
+    """Grid.render through a TileCache"""
+    if cache is None:
+        cache = TILE_CACHE
+    img = np.zeros(shape=(grid.height * tile_size, grid.width * tile_size, 3), dtype=np.uint8)
+    agent_x, agent_y = (-1, -1) if agent_pos is None else (int(agent_pos[0]), int(agent_pos[1]))
+
+    for j in range(grid.height):
+        for i in range(grid.width):
+            tile = cache.render_tile(
+                grid.get(i, j),
+                agent_dir=agent_dir if i == agent_x and j == agent_y else None,
+                highlight=highlight_mask is not None and highlight_mask[i, j],
+                tile_size=tile_size,
+            )
+            img[j * tile_size:(j + 1) * tile_size, i * tile_size:(i + 1) * tile_size] = tile
+
+    return img
+
+
+# DIR_TO_VEC as an array indexed by agent_dir
+DIR_VECS = np.array([(1, 0), (0, 1), (-1, 0), (0, -1)])
+
+
+def view_coords(agent_pos, agent_dir, view_size):
+    """
+    World coordinates of the agent view cells of B agents, as two
+    (B, view_size, view_size) arrays indexed like the gen_obs_grid grid
+    """
+    agent_pos = np.asarray(agent_pos).reshape(-1, 2)
+    f_vec = DIR_VECS[np.asarray(agent_dir).reshape(-1)]
+    r_vec = np.stack([-f_vec[:, 1], f_vec[:, 0]], axis=1)
+    top_left = agent_pos + f_vec * (view_size - 1) - r_vec * (view_size // 2)
+
+    vis_i = np.arange(view_size)[None, :, None]
+    vis_j = np.arange(view_size)[None, None, :]
+    x = top_left[:, 0, None, None] - f_vec[:, 0, None, None] * vis_j + r_vec[:, 0, None, None] * vis_i
+    y = top_left[:, 1, None, None] - f_vec[:, 1, None, None] * vis_j + r_vec[:, 1, None, None] * vis_i
+    return x, y
+
+
+class TileAtlas(object):
+    """
+    Tiles of every (type, color, state) cell code of the minigrid objects
+    and the SGWorldObj subclasses, plain and highlighted, indexed through a
+    code lookup table. Tiles are drawn the first time a code is rendered.
+
+    Codes don't hold the button of a ButtonDoor, doors are drawn with a
+    button of their own color as in the registered envs.
+    """
+    def __init__(self, tile_size=TILE_PIXELS, max_obj_id=16):
+        self.tile_size = tile_size
+        n_states = max(3, max_obj_id + 1)
+        # code -> atlas entry, entry 0 is the empty cell (also unseen)
+        self.lut = np.zeros((len(NEW_OBJECT_TO_IDX), len(COLOR_TO_IDX), n_states), dtype=np.int32)
+        self.objs = [None]
+        for obj_type, type_idx in NEW_OBJECT_TO_IDX.items():
+            for color, color_idx in COLOR_TO_IDX.items():
+                if obj_type in ('unseen', 'empty', 'agent'):
+                    continue
+                elif obj_type == 'door':
+                    objs = [WorldObj.decode(type_idx, color_idx, state) for state in range(3)]
+                elif obj_type == 'button':
+                    objs = [Button(color, state == 0) for state in range(2)]
+                elif obj_type == 'buttondoor':
+                    objs = [ButtonDoor(Button(color), color, state == 0) for state in range(2)]
+                elif obj_type == 'collectible':
+                    objs = [Collectible('', color, {}, None, obj_id) for obj_id in range(max_obj_id + 1)]
+                elif obj_type == 'interactable':
+                    objs = [Interactable('', color, {}, obj_id) for obj_id in range(max_obj_id + 1)]
+                else:
+                    objs = [WorldObj.decode(type_idx, color_idx, 0)]
+                for state, obj in enumerate(objs):
+                    self.lut[type_idx, color_idx, state] = len(self.objs)
+                    self.objs.append(obj)
+
+        self.tiles = np.zeros((len(self.objs), 2, tile_size, tile_size, 3), dtype=np.uint8)
+        self.ready = np.zeros((len(self.objs), 2), dtype=bool)
+        # agent tiles, (entry, agent_dir, highlight) -> tile
+        self.agent_tiles = {}
+
+    def entries(self, codes):
+        """Atlas entries of (..., 3) cell codes"""
+        return self.lut[codes[..., 0], codes[..., 1], codes[..., 2]]
+
+    def prepare(self, entries, highlight):
+        """Draw the tiles of entries not drawn yet"""
+        missing = ~self.ready[entries, highlight.astype(np.intp)]
+        if missing.any():
+            for entry, hl in set(zip(entries[missing].tolist(), highlight[missing].tolist())):
+                self.tiles[entry, int(hl)] = draw_tile(self.objs[entry], None, hl, self.tile_size)
+                self.ready[entry, int(hl)] = True
+
+    def agent_tile(self, entry, agent_dir, highlight):
+        key = (entry, agent_dir, highlight)
+        tile = self.agent_tiles.get(key, None)
+        if tile is None:
+            tile = self.agent_tiles[key] = draw_tile(self.objs[entry], agent_dir, highlight, self.tile_size)
+        return tile
+
+    def render(self, codes, agent_pos, agent_dir, highlight_mask=None):
+        """
+        (B, H * tile_size, W * tile_size, 3) frames of (B, W, H, 3) codes,
+        with agents at agent_pos (B, 2) facing agent_dir (B,)
+        """
+        ts = self.tile_size
+        entries = self.entries(codes)
+        if highlight_mask is None:
+            highlight_mask = np.zeros(entries.shape, dtype=bool)
+        self.prepare(entries, highlight_mask)
+
+        # (B, W, H, ts, ts, 3) -> (B, H, ts, W, ts, 3)
+        tiles = self.tiles[entries, highlight_mask.astype(np.intp)]
+        n, width, height = entries.shape
+        frames = tiles.transpose(0, 2, 3, 1, 4, 5).reshape(n, height * ts, width * ts, 3)
+
+        for b in range(n):
+            x, y = int(agent_pos[b][0]), int(agent_pos[b][1])
+            tile = self.agent_tile(int(entries[b, x, y]), int(agent_dir[b]), bool(highlight_mask[b, x, y]))
+            frames[b, y * ts:(y + 1) * ts, x * ts:(x + 1) * ts] = tile
+        return frames
+
+
+class BatchRenderer(object):
+    """
+    RGB frames of B envs at once from their stacked cell codes, gathered
+    from a TileAtlas. Frames are identical to env.get_frame, except for a
+    ButtonDoor whose button has another color than the door (as in
+    SGMG-ButtonTest-v0): codes don't hold the button color, so the door
+    is drawn with a button of its own color.
+
+    POV frames need the visibility mask to highlight the visible cells and
+    clear the others, it can be taken from partial observations as
+    obs['image'][..., 0] != 0.
+    """
+    def __init__(self, tile_size=TILE_PIXELS, view_size=7, max_obj_id=16):
+        self.atlas = TileAtlas(tile_size, max_obj_id)
+        self.view_size = view_size
+        self.wall_code = np.array((OBJECT_TO_IDX['wall'], COLOR_TO_IDX['grey'], 0), dtype=np.uint8)
+        self.empty_code = np.array((OBJECT_TO_IDX['empty'], 0, 0), dtype=np.uint8)
+
+    def render_full(self, codes, agent_pos, agent_dir, vis_mask=None):
+        """
+        Full grid frames of (B, W, H, 3) codes, highlighting the cells of
+        the (B, view_size, view_size) vis_mask when given
+        """
+        codes = np.asarray(codes)
+        agent_pos = np.asarray(agent_pos).reshape(-1, 2)
+        agent_dir = np.asarray(agent_dir).reshape(-1)
+        highlight_mask = None
+        if vis_mask is not None:
+            n, width, height = codes.shape[:3]
+            x, y = view_coords(agent_pos, agent_dir, self.view_size)
+            b = np.broadcast_to(np.arange(n)[:, None, None], x.shape)
+            keep = np.asarray(vis_mask, dtype=bool) & (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            highlight_mask = np.zeros((n, width, height), dtype=bool)
+            highlight_mask[b[keep], x[keep], y[keep]] = True
+        return self.atlas.render(codes, agent_pos, agent_dir, highlight_mask)
+
+    def view_codes(self, codes, agent_pos, agent_dir, carrying=None):
+        """
+        (B, view_size, view_size, 3) codes of the agent views, walls outside
+        the grid and the carried object (B, 3) codes at the agent cell
+        """
+        codes = np.asarray(codes)
+        n, width, height = codes.shape[:3]
+        v = self.view_size
+        x, y = view_coords(agent_pos, agent_dir, v)
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        b = np.broadcast_to(np.arange(n)[:, None, None], x.shape)
+        view = np.empty((n, v, v, 3), dtype=codes.dtype)
+        view[...] = self.wall_code
+        view[inside] = codes[b[inside], x[inside], y[inside]]
+        view[:, v // 2, v - 1] = self.empty_code if carrying is None else carrying
+        return view
+
+    def render_pov(self, codes, agent_pos, agent_dir, vis_mask=None, carrying=None):
+        """Agent view frames of (B, W, H, 3) codes, as get_pov_render"""
+        view = self.view_codes(codes, agent_pos, agent_dir, carrying)
+        n, v = len(view), self.view_size
+        highlight_mask = None
+        if vis_mask is not None:
+            # process_vis clears the cells the agent can't see
+            highlight_mask = np.asarray(vis_mask, dtype=bool)
+            view[~highlight_mask] = self.empty_code
+        agent_pos = np.broadcast_to((v // 2, v - 1), (n, 2))
+        agent_dir = np.full(n, 3)
+        return self.atlas.render(view, agent_pos, agent_dir, highlight_mask)
+
+    def render_envs(self, envs, agent_pov=False, highlight=True):
+        """Frames of a list of SGMG envs, as their get_frame"""
+        envs = [env.unwrapped for env in envs]
+        codes = np.stack([env._grid_codes() for env in envs])
+        agent_pos = np.array([env.agent_pos for env in envs])
+        agent_dir = np.array([env.agent_dir for env in envs])
+        vis_mask = None
+        if agent_pov or highlight:
+            vis_mask = np.stack([env.gen_obs_grid()[1] for env in envs])
+        if agent_pov:
+            carrying = np.array([
+                self.empty_code if env.carrying is None else env.carrying.encode()
+                for env in envs
+            ], dtype=codes.dtype)
+            return self.render_pov(codes, agent_pos, agent_dir, vis_mask, carrying)
+        return self.render_full(codes, agent_pos, agent_dir, vis_mask)
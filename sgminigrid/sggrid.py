@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import numpy as np
+
+from minigrid.core.constants import OBJECT_TO_IDX
+from minigrid.core.grid import Grid
+from minigrid.core.world_object import WorldObj
+from sgminigrid.sgworld_object import SGWorldObj
+
+
+class SGGrid(Grid):
+    """
+    Grid that keeps the (type, color, state) encoding of every cell in a
+    persistent uint8 array, updated in place whenever a cell changes
+    """
+
+    def __init__(self, width: int, height: int):
+        super().__init__(width, height)
+        self.codes = np.zeros((width, height, 3), dtype=np.uint8)
+        self.codes[:, :, 0] = OBJECT_TO_IDX["empty"]
+
+    def set(self, i: int, j: int, v: WorldObj | None):
+        super().set(i, j, v)
+        if v is None:
+            self.codes[i, j] = (OBJECT_TO_IDX["empty"], 0, 0)
+        else:
+            self.codes[i, j] = v.encode()
+            if isinstance(v, SGWorldObj):
+                v.grid = self
+
+    def refresh(self, i: int, j: int):
+        """Re-encode cell (i, j) after its object changed state"""
+        if 0 <= i < self.width and 0 <= j < self.height:
+            v = self.get(i, j)
+            if v is not None:
+                self.codes[i, j] = v.encode()
+
+    def codes_view(self) -> np.ndarray:
+        """Read-only view of the cell codes, without the copy of encode"""
+        codes = self.codes.view()
+        codes.flags.writeable = False
+        return codes
+
+    def encode(self, vis_mask: np.ndarray | None = None) -> np.ndarray:
+        array = self.codes.copy()
+        if vis_mask is None:
+            return array
+        array[~vis_mask] = 0
+        return array
@@ -1,10 +1,132 @@
-from gymnasium import spaces
-from minigrid.core.constants import TILE_PIXELS
+import dataclasses
+import math
+from collections import namedtuple
+
+import numpy as np
+from gymnasium import registry, spaces
+from minigrid.core.constants import COLOR_TO_IDX, OBJECT_TO_IDX, TILE_PIXELS
 from minigrid.core.mission import MissionSpace
+from minigrid.core.grid import Grid
+from minigrid.core.world_object import Wall
 from minigrid.minigrid_env import MiniGridEnv
+from sgminigrid.layout_bank import Layout, LayoutBank
+from sgminigrid.profiling import PhaseTimer
+from sgminigrid.rendering import TILE_CACHE, render_grid, view_coords
+from sgminigrid.sggrid import SGGrid
+from sgminigrid.sgworld_object import NEW_OBJECT_TO_IDX, SGWorldObj
 from sgminigrid.utils import MissionLookup
 
+EnvState = namedtuple('EnvState', [
+    'episode', 'cells', 'codes', 'flags', 'positions', 'carrying',
+    'agent_pos', 'agent_dir', 'step_count', 'extra',
+])
+
+WALL_CODE = (OBJECT_TO_IDX["wall"], COLOR_TO_IDX["grey"], 0)
+EMPTY_CODE = (OBJECT_TO_IDX["empty"], 0, 0)
+
+
+# cells that can't be seen behind, by (type, state) code, as see_behind()
+OPAQUE = np.zeros((256, 256), dtype=bool)
+OPAQUE[OBJECT_TO_IDX["wall"], :] = True
+OPAQUE[OBJECT_TO_IDX["door"], 1:] = True# closed or locked
+OPAQUE[NEW_OBJECT_TO_IDX["buttondoor"], 1:] = True# closed
+
+# full_obs cell codes by (type, state) code, as CompactCraftObsWrapper:
+# the object type, with collectibles and interactables at 4 + obj_id
+COMPACT = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 256, axis=1)
+COMPACT[NEW_OBJECT_TO_IDX["collectible"], :252] = 4 + np.arange(252)
+COMPACT[NEW_OBJECT_TO_IDX["interactable"], :252] = 4 + np.arange(252)
+COMPACT_AGENT = 3
+
+# visibility masks by agent view opacity, shared by all envs of a process
+VIS_CACHE_SIZE = 65536
+_vis_cache = {}
+
+
+def opaque_cells(codes):
+    """Cells of (..., 3) codes that can't be seen behind"""
+    return OPAQUE[codes[..., 0], codes[..., 2]]
+
+
+def process_vis(opaque):
+    """Grid.process_vis of an agent view, given its opaque cells"""
+    width, height = opaque.shape
+    opaque = opaque.tolist()
+    mask = np.zeros((width, height), dtype=bool).tolist()
+    mask[width // 2][height - 1] = True
+
+    for j in reversed(range(0, height)):
+        for i in range(0, width - 1):
+            if not mask[i][j] or opaque[i][j]:
+                continue
+            mask[i + 1][j] = True
+            if j > 0:
+                mask[i + 1][j - 1] = True
+                mask[i][j - 1] = True
+
+        for i in reversed(range(1, width)):
+            if not mask[i][j] or opaque[i][j]:
+                continue
+            mask[i - 1][j] = True
+            if j > 0:
+                mask[i - 1][j - 1] = True
+                mask[i][j - 1] = True
+
+    return np.array(mask, dtype=bool)
+
+
+def visibility(opaque):
+    """
+    process_vis of an agent view, cached on its opaque cells, which is all
+    the mask depends on. Door changes and new poses change the key, turning
+    back to a seen view is a lookup.
+    """
+    key = (opaque.shape[0], opaque.tobytes())
+    mask = _vis_cache.get(key, None)
+    if mask is None:
+        if len(_vis_cache) >= VIS_CACHE_SIZE:
+            _vis_cache.clear()
+        mask = process_vis(opaque)
+        mask.flags.writeable = False
+        _vis_cache[key] = mask
+    return mask
+
 class SGMiniGridEnv(MiniGridEnv):
+    # object attributes recorded in a state snapshot
+    STATE_FLAGS = ('is_open', 'is_locked', 'is_pressed')
+    # methods timed by enable_profiling, and their phase names
+    PROFILE_PHASES = {
+        'step': 'step',
+        '_base_step': 'step.minigrid',
+        '_update_completions': 'completions',
+        'reset': 'reset',
+        '_base_reset': 'reset.minigrid',
+        '_gen_grid': 'reset.gen_grid',
+        'place_obj': 'reset.place_obj',
+        'place_objs': 'reset.place_objs',
+        'gen_obs': 'gen_obs',
+    }
+    # envs that restore their attributes from a Layout in _load_layout
+    SUPPORTS_LAYOUT_BANK = False
+    # envs whose cells COMPACT encodes without losing color or state, and
+    # that have nothing to carry, as full_obs requires
+    LOSSLESS_COMPACT = False
+    # largest full_obs cell code
+    FULL_OBS_HIGH = max(NEW_OBJECT_TO_IDX.values())
+    # attributes left out of pickles, rebuilt by __init__ on unpickling
+    PICKLE_SKIP = (
+        'observation_space', 'action_space', 'mission_space', 'completion_space',
+        'mission_lookup', 'completion_lookup', 'actions', 'reward_range',
+        'window', 'tile_cache', 'layout_bank', '_view_offsets',
+        'timer', 'profile_info', '_state_objs', '_state_attrs',
+    )
+
+    def __new__(cls, *args, **kwargs):
+        env = super().__new__(cls)
+        # constructor arguments, replayed by __setstate__
+        env._init_args = (args, kwargs)
+        return env
+
     def __init__(
         self,
         mission_space: MissionSpace,
@@ -19,8 +141,23 @@ class SGMiniGridEnv(MiniGridEnv):
         tile_size: int = TILE_PIXELS,
         agent_pov: bool = False,
         completion_space: MissionSpace | None = None,
+        array_grid: bool = False,
+        layout_bank: str | LayoutBank | None = None,
+        profile: bool = False,
+        profile_info: bool = False,
+        full_obs: bool = False,
     ):
         #self.completion_space = mission_space
+        if full_obs and not self.LOSSLESS_COMPACT:
+            raise ValueError(f"{type(self).__name__} has no lossless compact encoding for full_obs")
+        # full observations are read from the cell codes of an SGGrid
+        self.full_obs = full_obs
+        self.array_grid = array_grid or full_obs
+        if layout_bank is not None and not self.SUPPORTS_LAYOUT_BANK:
+            raise ValueError(f"{type(self).__name__} does not support layout banks")
+        if isinstance(layout_bank, str):
+            layout_bank = LayoutBank(layout_bank)
+        self.layout_bank = layout_bank
         super().__init__(
             mission_space,
             grid_size,
@@ -41,8 +178,30 @@ class SGMiniGridEnv(MiniGridEnv):
         self.mission_space = mission_space
         self.completion_lookup = MissionLookup(self.completion_space)
         self.mission_lookup = MissionLookup(self.mission_space)
+        self.completion = np.zeros(self.completion_lookup.n_missions, dtype=np.bool_)
+        self._episode = 0
+        self._state_objs = None
+        self.timer = None
+        self.profile_info = False
+        self.tile_cache = TILE_CACHE
+        # agent view cell offsets from the agent, per direction
+        self._view_offsets = np.stack([
+            np.concatenate(view_coords((0, 0), agent_dir, self.agent_view_size))
+            for agent_dir in range(4)
+        ])
+        if profile or profile_info:
+            self.enable_profiling(info=profile_info)
+        if full_obs:
+            image_space = spaces.Box(
+                low=0,
+                high=self.FULL_OBS_HIGH,
+                shape=(self.width, self.height),
+                dtype="uint8",
+            )
+        else:
+            image_space = self.observation_space['image']
         sg_observation_space = spaces.Dict({
-            'image': self.observation_space['image'],
+            'image': image_space,
             "direction": self.observation_space['direction'],
             "mission": self.observation_space['mission'],
             "mission_id": spaces.Discrete(self.mission_lookup.n_missions),
@@ -50,6 +209,350 @@ class SGMiniGridEnv(MiniGridEnv):
         })
         self.observation_space = sg_observation_space
 
+    def _make_grid(self, width, height):
+        if self.array_grid:
+            return SGGrid(width, height)
+        return Grid(width, height)
+
+    def _free_cells(self, top=None, size=None, reject_fn=None):
+        """
+        Cells an object can be placed on, in x-major order: empty, not
+        under the agent, inside the rectangle and not rejected by reject_fn
+        """
+        if top is None:
+            top = (0, 0)
+        else:
+            top = (max(top[0], 0), max(top[1], 0))
+        if size is None:
+            size = (self.grid.width, self.grid.height)
+
+        if isinstance(self.grid, SGGrid):
+            occupied = self.grid.codes[:, :, 0] != OBJECT_TO_IDX["empty"]
+        else:
+            occupied = np.array([v is not None for v in self.grid.grid], dtype=np.bool_)
+            occupied = occupied.reshape(self.grid.height, self.grid.width).T
+        eligible = np.zeros_like(occupied)
+        eligible[top[0]:top[0] + size[0], top[1]:top[1] + size[1]] = True
+        eligible &= ~occupied
+        if self.agent_pos is not None:
+            x, y = self.agent_pos
+            if 0 <= x < self.grid.width and 0 <= y < self.grid.height:
+                eligible[x, y] = False
+
+        cells = np.argwhere(eligible)
+        if reject_fn is not None and len(cells) > 0:
+            keep = np.array([not reject_fn(self, (x, y)) for x, y in cells.tolist()], dtype=np.bool_)
+            cells = cells[keep]
+        return cells
+
+    def place_obj(self, obj, top=None, size=None, reject_fn=None, max_tries=math.inf, rng=None):
+        """
+        Place an object at a uniformly sampled eligible cell. Draws once from
+        the free cells instead of minigrid's rejection sampling; max_tries is
+        kept for signature compatibility.
+        """
+        if rng is None:
+            rng = self.np_random
+        cells = self._free_cells(top, size, reject_fn)
+        if len(cells) == 0:
+            raise RecursionError("no free cell to place object in place_obj")
+
+        pos = tuple(cells[rng.integers(len(cells))].tolist())
+        if obj is not None:
+            self.put_obj(obj, *pos)
+        return pos
+
+    def place_objs(self, objs, top=None, size=None, reject_fn=None, rng=None):
+        """
+        Place all objects at once on distinct cells drawn with one permutation
+        """
+        if rng is None:
+            rng = self.np_random
+        cells = self._free_cells(top, size, reject_fn)
+        if len(cells) < len(objs):
+            raise RecursionError("not enough free cells in place_objs")
+
+        cells = cells[rng.permutation(len(cells))[:len(objs)]]
+        positions = [tuple(pos) for pos in cells.tolist()]
+        for obj, pos in zip(objs, positions):
+            self.put_obj(obj, *pos)
+        return positions
+
+    def get_layout(self):
+        """Layout of the current episode, as stored in a LayoutBank"""
+        return Layout(
+            cells=self.grid.encode(),
+            agent_pos=tuple(int(v) for v in self.agent_pos),
+            agent_dir=int(self.agent_dir),
+            mission_id=self.mission_id,
+            tags=list(self.task_infos.get('tags', [])),
+        )
+
+    def _decode_obj(self, type_idx, color_idx, state):
+        return SGWorldObj.decode(type_idx, color_idx, state)
+
+    def _load_layout(self, layout):
+        """
+        Rebuild an episode from a Layout in place of _gen_grid. Envs that
+        support layout banks override this to restore their own attributes.
+        """
+        self.task_infos = {'tags': list(layout.tags)}
+        self.mission = self.mission_lookup.id_to_mission[layout.mission_id]
+
+        width, height = layout.cells.shape[:2]
+        self.grid = self._make_grid(width, height)
+        wall = Wall()# walls are stateless, one is shared by all wall cells
+        for i, j in np.argwhere(layout.cells[:, :, 0] != OBJECT_TO_IDX["empty"]).tolist():
+            type_idx, color_idx, state = layout.cells[i, j].tolist()
+            if type_idx == OBJECT_TO_IDX["wall"]:
+                self.grid.set(i, j, wall)
+            else:
+                self.put_obj(self._decode_obj(type_idx, color_idx, state), i, j)
+
+        self.agent_pos = layout.agent_pos
+        self.agent_dir = layout.agent_dir
+
+    def _reset_from_bank(self, seed=None, options=None):
+        """MiniGridEnv.reset with the grid loaded from the layout bank"""
+        super(MiniGridEnv, self).reset(seed=seed)
+        index = options.get('layout_index', None)
+        if index is None:
+            index = self.layout_bank.sample_index(self.np_random, seed=seed, task_id=options.get('task_id', None))
+        self._load_layout(self.layout_bank[index])
+
+        self.carrying = None
+        self.step_count = 0
+        if self.render_mode == "human":
+            self.render()
+        return self.gen_obs(), {}
+
+    def _state_objects(self):
+        """Non wall objects of the episode, collected on the first snapshot"""
+        if self._state_objs is None:
+            objs = [v for v in self.grid.grid if v is not None and v.type != 'wall']
+            if self.carrying is not None:
+                objs.append(self.carrying)
+            self._state_objs = objs
+            self._state_attrs = [(obj, a) for obj in objs for a in self.STATE_FLAGS if hasattr(obj, a)]
+        return self._state_objs
+
+    def _get_extra_state(self):
+        return None
+
+    def _set_extra_state(self, extra):
+        pass
+
+    def get_state(self):
+        """
+        Snapshot of the mutable episode state. Cells hold references to
+        the episode's objects, so a snapshot can only be restored before
+        the next reset.
+        """
+        objs = self._state_objects()
+        codes = None
+        if isinstance(self.grid, SGGrid):
+            codes = self.grid.codes.copy()
+            codes.flags.writeable = False
+        return EnvState(
+            episode=self._episode,
+            cells=tuple(self.grid.grid),
+            codes=codes,
+            flags=tuple(getattr(obj, a) for obj, a in self._state_attrs),
+            positions=tuple(obj.cur_pos for obj in objs),
+            carrying=self.carrying,
+            agent_pos=self.agent_pos,
+            agent_dir=self.agent_dir,
+            step_count=self.step_count,
+            extra=self._get_extra_state(),
+        )
+
+    def set_state(self, state):
+        """Restore a snapshot from get_state in place"""
+        if state.episode != self._episode:
+            raise ValueError("state was saved in a different episode")
+        self.grid.grid[:] = state.cells
+        for obj, pos in zip(self._state_objs, state.positions):
+            obj.cur_pos = pos
+        for (obj, a), value in zip(self._state_attrs, state.flags):
+            setattr(obj, a, value)
+        if state.codes is not None:
+            self.grid.codes[...] = state.codes
+        self.carrying = state.carrying
+        self.agent_pos = state.agent_pos
+        self.agent_dir = state.agent_dir
+        self.step_count = state.step_count
+        self._set_extra_state(state.extra)
+        self._update_completions(self.completion)
+
+    def __getstate__(self):
+        """
+        Episode attributes without the spaces, renderer and profiler, which
+        __setstate__ rebuilds by rerunning __init__. Walls are stored as a
+        bitmask and the other cells as their objects, so references to them
+        from env attributes survive. Timings are not kept.
+        """
+        skip = set(self.PICKLE_SKIP) | set(self.PROFILE_PHASES)
+        state = {k: v for k, v in self.__dict__.items() if k not in skip}
+        state['_profile'] = None if self.timer is None else self.profile_info
+        spec = state.get('spec')
+        if spec is not None and spec.id in registry:
+            # the fields gym.make changed from the registered spec
+            registered = registry[spec.id]
+            state['spec'] = (spec.id, {
+                f.name: getattr(spec, f.name) for f in dataclasses.fields(spec)
+                if getattr(spec, f.name) != getattr(registered, f.name)
+            })
+        if self.grid is not None:
+            cells = self.grid.grid
+            walls = np.packbits([v is not None and v.encode() == WALL_CODE for v in cells])
+            objs = [(i, v) for i, v in enumerate(cells) if v is not None and v.encode() != WALL_CODE]
+            state['grid'] = (self.grid.width, self.grid.height, walls.tobytes(), objs)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        args, kwargs = state.pop('_init_args')
+        profile = state.pop('_profile')
+        grid = state.pop('grid', None)
+        self.__init__(*args, **kwargs)
+        # __new__ ran without arguments when unpickling
+        self._init_args = (args, kwargs)
+        if isinstance(state.get('spec'), tuple):
+            env_id, changed = state['spec']
+            state['spec'] = dataclasses.replace(registry[env_id], **changed)
+        self.__dict__.update(state)
+
+        self.disable_profiling()
+        if profile is not None:
+            self.enable_profiling(info=profile)
+
+        if grid is not None:
+            width, height, walls, objs = grid
+            self.grid = self._make_grid(width, height)
+            wall = Wall()
+            walls = np.unpackbits(np.frombuffer(walls, dtype=np.uint8), count=width * height)
+            for i in np.flatnonzero(walls).tolist():
+                self.grid.set(i % width, i // width, wall)
+            for i, obj in objs:
+                if isinstance(obj, SGWorldObj):
+                    obj.grid = self.grid
+                self.grid.set(i % width, i // width, obj)
+
+    def enable_profiling(self, info=False):
+        """
+        Record time and call counts of each phase of step and reset, adding
+        them to info['timings'] when `info` is set. Disabled envs run the
+        plain methods.
+        """
+        if self.timer is None:
+            self.timer = PhaseTimer()
+            for name, phase in self.PROFILE_PHASES.items():
+                self.timer.wrap(self, name, phase)
+        self.profile_info = info
+        return self.timer
+
+    def disable_profiling(self):
+        if self.timer is not None:
+            for name in self.PROFILE_PHASES:
+                PhaseTimer.unwrap(self, name)
+        self.timer = None
+        self.profile_info = False
+
+    def timings(self):
+        """Phase statistics since profiling was enabled or reset_timings"""
+        return {} if self.timer is None else self.timer.stats()
+
+    def reset_timings(self):
+        if self.timer is not None:
+            self.timer.clear()
+
+    def _grid_codes(self):
+        if isinstance(self.grid, SGGrid):
+            # toggled minigrid objects (e.g. Door) don't notify the grid
+            self.grid.refresh(*self.front_pos)
+            return self.grid.codes_view()
+        return self.grid.encode()
+
+    def gen_obs_codes(self):
+        """
+        Codes of the agent view and its visibility mask, as encoding the
+        gen_obs_grid grid. The view is gathered from the grid codes with
+        index tables rather than slicing and rotating the grid.
+        """
+        codes = self._grid_codes()
+        x, y = self._view_offsets[self.agent_dir]
+        x = x + self.agent_pos[0]
+        y = y + self.agent_pos[1]
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        view = np.empty((*x.shape, 3), dtype=np.uint8)
+        view[...] = WALL_CODE
+        view[inside] = codes[x[inside], y[inside]]
+
+        v = self.agent_view_size
+        if self.see_through_walls:
+            vis_mask = np.ones((v, v), dtype=bool)
+        else:
+            vis_mask = visibility(opaque_cells(view))
+
+        # the agent sees what it's carrying
+        view[v // 2, v - 1] = EMPTY_CODE if self.carrying is None else self.carrying.encode()
+        return view, vis_mask
+
+    def gen_full_obs(self):
+        """(W, H) compact codes of the whole grid, with the agent"""
+        codes = self._grid_codes()
+        image = COMPACT[codes[:, :, 0], codes[:, :, 2]]
+        image[self.agent_pos[0], self.agent_pos[1]] = COMPACT_AGENT
+        return image
+
+    def gen_obs(self):
+        if self.full_obs:
+            return {"image": self.gen_full_obs(), "direction": self.agent_dir, "mission": self.mission}
+        image, vis_mask = self.gen_obs_codes()
+        image[~vis_mask] = 0
+        return {"image": image, "direction": self.agent_dir, "mission": self.mission}
+
+    def get_pov_render(self, tile_size):
+        grid, vis_mask = self.gen_obs_grid()
+        return render_grid(
+            grid,
+            tile_size,
+            agent_pos=(self.agent_view_size // 2, self.agent_view_size - 1),
+            agent_dir=3,
+            highlight_mask=vis_mask,
+            cache=self.tile_cache,
+        )
+
+    def get_full_render(self, highlight, tile_size):
+        highlight_mask = None
+        if highlight:
+            _, vis_mask = self.gen_obs_grid()
+
+            # world coordinates of every cell of the agent's view
+            f_vec = self.dir_vec
+            r_vec = self.right_vec
+            top_left = (
+                self.agent_pos
+                + f_vec * (self.agent_view_size - 1)
+                - r_vec * (self.agent_view_size // 2)
+            )
+            vis_i, vis_j = np.nonzero(vis_mask)
+            abs_i = top_left[0] - f_vec[0] * vis_j + r_vec[0] * vis_i
+            abs_j = top_left[1] - f_vec[1] * vis_j + r_vec[1] * vis_i
+            inside = (abs_i >= 0) & (abs_i < self.width) & (abs_j >= 0) & (abs_j < self.height)
+
+            highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
+            highlight_mask[abs_i[inside], abs_j[inside]] = True
+
+        return render_grid(
+            self.grid,
+            tile_size,
+            self.agent_pos,
+            self.agent_dir,
+            highlight_mask=highlight_mask,
+            cache=self.tile_cache,
+        )
+
     def train(self):
         pass
     def eval(self):
@@ -58,25 +561,52 @@ class SGMiniGridEnv(MiniGridEnv):
     def _subtask_completions(self):
         return {}
 
+    def _update_completions(self, completion):
+        """
+        Write subtask completion bits into the preallocated completion vector.
+        Subclasses override this to set bits by completion id directly.
+        """
+        completion[:] = False
+        for subtask, val in self._subtask_completions().items():
+            completion[self.completion_lookup.mission_to_id[subtask]] = val
+
     def _reward(self):
         return 1.0
 
     def _sample_task(self, task_id=None):
         pass
 
+    def _base_reset(self, *args, seed=None, options=None):
+        return super().reset(*args, seed=seed, options=options)
+
+    def _base_step(self, action):
+        return super().step(action)
+
     def reset(self, *args, seed=None, options=None):
         self.task_infos = {}
+        self._episode += 1
+        self._state_objs = None
         options = {} if options is None else options
-        self._sample_task(task_id=options.get('task_id', None))
-        obs, info = super().reset(*args, seed=seed, options=options)
-        obs['completion'] = self.completion_lookup.dict_to_vec(self._subtask_completions())
-        obs['mission_id'] = self.mission_lookup.mission_to_id[obs['mission']]
+        if self.layout_bank is not None:
+            obs, info = self._reset_from_bank(seed=seed, options=options)
+        else:
+            self._sample_task(task_id=options.get('task_id', None))
+            obs, info = self._base_reset(*args, seed=seed, options=options)
+        self.mission_id = self.mission_lookup.mission_to_id[self.mission]
+        self._update_completions(self.completion)
+        obs['completion'] = self.completion.copy()
+        obs['mission_id'] = self.mission_id
         info.update(self.task_infos)
+        if self.profile_info:
+            info['timings'] = self.timer.stats()
         return obs, info
 
     def step(self, action):
-        obs, reward, terminated, truncated, info = super().step(action)
-        obs['completion'] = self.completion_lookup.dict_to_vec(self._subtask_completions())
-        obs['mission_id'] = self.mission_lookup.mission_to_id[obs['mission']]
+        obs, reward, terminated, truncated, info = self._base_step(action)
+        self._update_completions(self.completion)
+        obs['completion'] = self.completion.copy()
+        obs['mission_id'] = self.mission_id
         info.update(self.task_infos)
+        if self.profile_info:
+            info['timings'] = self.timer.stats()
         return obs, reward, terminated, truncated, info
@@ -45,6 +45,8 @@ NEW_OBJECT_TO_IDX = {
 NEW_IDX_TO_OBJECT = dict(zip(NEW_OBJECT_TO_IDX.values(), NEW_OBJECT_TO_IDX.keys()))
 
 class SGWorldObj(WorldObj):
+    __slots__ = ('type', 'color', 'contains', 'init_pos', 'cur_pos', 'grid', '_encoding')
+
     def __init__(self, type: str, color: str):
         assert type in NEW_OBJECT_TO_IDX, type
         assert color in COLOR_TO_IDX, color
@@ -58,22 +60,60 @@ class SGWorldObj(WorldObj):
         # Current position of the object
         self.cur_pos: Point | None = None
 
+        # Array-backed grid holding this object, set by SGGrid.set
+        self.grid = None
+
+        # encode() result, None when the state changed since
+        self._encoding = None
+
+    def _changed(self):
+        """Re-encode this object and its cell after a state change"""
+        self._encoding = None
+        refresh = getattr(self.grid, 'refresh', None)
+        if refresh is not None and self.cur_pos is not None:
+            refresh(*self.cur_pos)
+
     def encode(self) -> tuple[int, int, int]:
         """Encode the a description of this object as a 3-tuple of integers"""
+        encoding = self._encoding
+        if encoding is None:
+            encoding = self._encoding = self._encode()
+        return encoding
+
+    def _encode(self) -> tuple[int, int, int]:
         return (NEW_OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], 0)
 
+    def tile_key(self) -> tuple:
+        """Key of the rendered tile, everything render depends on"""
+        return self.encode()
+
+    def __getstate__(self):
+        # the grid is relinked by the env holding this object
+        state = dict(getattr(self, '__dict__', {}))
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name not in ('grid', '_encoding') and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        self.grid = None
+        self._encoding = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
     @staticmethod
     def decode(type_idx: int, color_idx: int, state: int) -> WorldObj | None:
         """Create an object from a 3-tuple state description"""
 
         if type_idx in IDX_TO_OBJECT:
-            return super().decode(type_idx, color_idx, state)
+            return WorldObj.decode(type_idx, color_idx, state)
 
         obj_type = NEW_IDX_TO_OBJECT[type_idx]
         color = IDX_TO_COLOR[color_idx]
 
         if obj_type == 'button':
-            v = Button(color, state == 1)
+            v = Button(color, state == 0)# 0: pressed, as in Button.encode
         elif obj_type == 'buttondoor':
             raise NotImplementedError
         else:
@@ -82,10 +122,21 @@ class SGWorldObj(WorldObj):
         return v
 
 class Button(SGWorldObj):
+    __slots__ = ('_is_pressed',)
+
     def __init__(self, color: str, is_pressed: bool = False):
         super().__init__("button", color)
         self.is_pressed = is_pressed
 
+    @property
+    def is_pressed(self):
+        return self._is_pressed
+
+    @is_pressed.setter
+    def is_pressed(self, value):
+        self._is_pressed = value
+        self._changed()
+
     def can_overlap(self):
         return True
 
@@ -96,9 +147,7 @@ class Button(SGWorldObj):
         self.is_pressed = not self.is_pressed
         return True
 
-    def encode(self):
-        """Encode the a description of this object as a 3-tuple of integers"""
-
+    def _encode(self):
         # State, 0: open, 1: closed, 2: locked
         if self.is_pressed:
             state = 0
@@ -118,11 +167,22 @@ class Button(SGWorldObj):
             fill_coords(img, point_in_circle(0.5, 0.5, 0.35), (0, 0, 0))
 
 class ButtonDoor(SGWorldObj):
+    __slots__ = ('button', '_is_open')
+
     def __init__(self, button: SGWorldObj, color: str, is_open: bool = False):
         super().__init__("buttondoor", color)
         self.button = button
         self.is_open = is_open
 
+    @property
+    def is_open(self):
+        return self._is_open
+
+    @is_open.setter
+    def is_open(self, value):
+        self._is_open = value
+        self._changed()
+
     def can_overlap(self):
         return self.is_open
 
@@ -136,9 +196,7 @@ class ButtonDoor(SGWorldObj):
         else:
             return False
 
-    def encode(self):
-        """Encode the a description of this object as a 3-tuple of integers"""
-
+    def _encode(self):
         # State, 0: open, 1: closed, 2: locked
         if self.is_open:
             state = 0
@@ -147,6 +205,10 @@ class ButtonDoor(SGWorldObj):
 
         return (NEW_OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], state)
 
+    def tile_key(self):
+        # the door is drawn with the color of its button
+        return self.encode() + (COLOR_TO_IDX[self.button.color],)
+
     def render(self, img):
         c = COLORS[self.color]
         button_c = COLORS[self.button.color]
@@ -166,6 +228,8 @@ class ButtonDoor(SGWorldObj):
             fill_coords(img, point_in_circle(cx=0.75, cy=0.50, r=0.08), c)
 
 class Collectible(SGWorldObj):
+    __slots__ = ('name', 'env_state', 'obj_id')
+
     def __init__(self, name: str, color: str, env_state: dict, grid, obj_id=0):
         super().__init__("collectible", color)
         self.name = name
@@ -186,9 +250,7 @@ class Collectible(SGWorldObj):
         self.env_state[self.name] = True
         return True
 
-    def encode(self):
-        """Encode the a description of this object as a 3-tuple of integers"""
-
+    def _encode(self):
         return (NEW_OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], self.obj_id)
 
     def render(self, img):
@@ -200,6 +262,8 @@ class Collectible(SGWorldObj):
         fill_coords(img, point_in_circle(0.5, 0.5, 0.4), c)
 
 class Interactable(SGWorldObj):
+    __slots__ = ('name', 'env_state', 'obj_id')
+
     def __init__(self, name: str, color: str, env_state: dict, obj_id=0):
         super().__init__("interactable", color)
         self.name = name
@@ -217,9 +281,7 @@ class Interactable(SGWorldObj):
         self.env_state[self.name] = True
         return True
 
-    def encode(self):
-        """Encode the a description of this object as a 3-tuple of integers"""
-
+    def _encode(self):
         return (NEW_OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], self.obj_id)
 
     def render(self, img):
@@ -0,0 +1,254 @@
+"""
+Multiprocess vector env for SGMG envs that exchanges observations through
+shared memory instead of pickling them through pipes.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import traceback
+
+import numpy as np
+
+OBS_KEYS = ('image', 'direction', 'mission_id', 'completion', 'sketch')
+
+# commands sent to workers
+STEP = b's'
+RESET = b'r'
+CLOSE = b'c'
+
+
+def _obs_fields(observation_space):
+    """(shape, dtype) of every shared observation field"""
+    fields = {}
+    for key in OBS_KEYS:
+        if key not in observation_space.spaces:
+            continue
+        space = observation_space[key]
+        shape = space.shape
+        if key == 'completion':
+            dtype = np.bool_
+        elif key == 'image':
+            dtype = space.dtype
+        else:
+            dtype = np.int64
+        fields[key] = (shape, np.dtype(dtype))
+    return fields
+
+
+class _SharedArrays(object):
+    """Named numpy arrays over RawArrays, rebuilt on the worker side from the same buffers"""
+    def __init__(self, specs, buffers):
+        self.specs = specs
+        self.buffers = buffers
+        self.arrays = {
+            name: np.frombuffer(buffers[name], dtype=dtype).reshape(shape)
+            for name, (shape, dtype) in specs.items()
+        }
+
+    @classmethod
+    def allocate(cls, ctx, specs):
+        buffers = {
+            name: ctx.RawArray('b', max(1, int(np.prod(shape)) * dtype.itemsize))
+            for name, (shape, dtype) in specs.items()
+        }
+        return cls(specs, buffers)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+
+def _write_obs(arrays, prefix, i, obs):
+    for key in OBS_KEYS:
+        name = prefix + key
+        if name in arrays.arrays:
+            arrays[name][i] = obs[key]
+
+
+def _worker(conn, env_fns, start, specs, buffers):
+    arrays = _SharedArrays(specs, buffers)
+    envs = [env_fn() for env_fn in env_fns]
+    actions = arrays['actions']
+    task_id = arrays['task_id']
+
+    def reset(i, env, seed=None):
+        options = {} if task_id[i] < 0 else {'task_id': int(task_id[i])}
+        obs, info = env.reset(seed=seed, options=options)
+        _write_obs(arrays, 'obs_', i, obs)
+
+    try:
+        while True:
+            cmd = conn.recv_bytes()
+            try:
+                if cmd == STEP:
+                    for i, env in enumerate(envs, start):
+                        obs, reward, terminated, truncated, info = env.step(actions[i])
+                        arrays['reward'][i] = reward
+                        arrays['terminated'][i] = terminated
+                        arrays['truncated'][i] = truncated
+                        if terminated or truncated:
+                            _write_obs(arrays, 'final_', i, obs)
+                            reset(i, env)
+                        else:
+                            _write_obs(arrays, 'obs_', i, obs)
+                elif cmd == RESET:
+                    for i, env in enumerate(envs, start):
+                        if not arrays['reset_mask'][i]:
+                            continue
+                        seed = int(arrays['seed'][i]) if arrays['has_seed'][i] else None
+                        reset(i, env, seed)
+                elif cmd == CLOSE:
+                    conn.send_bytes(b'')
+                    break
+                conn.send_bytes(b'')
+            except Exception:
+                conn.send_bytes(b'E' + traceback.format_exc().encode())
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        for env in envs:
+            env.close()
+        conn.close()
+
+
+class SGMGVectorEnv(object):
+    """
+    Steps env_fns in worker processes, each running a contiguous block of
+    envs. Workers write 'image', 'direction', 'mission_id', 'completion'
+    and 'sketch' (when the env has it) into shared arrays and only signal
+    through their pipe; the 'mission' string is not returned.
+
+    Finished envs are reset during step. Their last observation is in
+    infos['final_observation'] (a dict of arrays) for the envs marked in
+    infos['_final_observation']. The task_id reset option, an int or a
+    sequence of per-env ids, also applies to the following autoresets.
+
+    An exception in an env closes the vector env and is raised from the
+    step or reset call, with the worker traceback.
+    """
+    def __init__(self, env_fns, num_workers=None, context=None, copy=True):
+        self.num_envs = len(env_fns)
+        if num_workers is None:
+            num_workers = os.cpu_count()
+        num_workers = max(1, min(num_workers, self.num_envs))
+        self.copy = copy
+
+        dummy_env = env_fns[0]()
+        self.single_observation_space = dummy_env.observation_space
+        self.single_action_space = dummy_env.action_space
+        dummy_env.close()
+        del dummy_env
+
+        n = self.num_envs
+        self.obs_fields = _obs_fields(self.single_observation_space)
+        specs = {
+            'actions': ((n,), np.dtype(np.int64)),
+            'reward': ((n,), np.dtype(np.float64)),
+            'terminated': ((n,), np.dtype(np.bool_)),
+            'truncated': ((n,), np.dtype(np.bool_)),
+            'reset_mask': ((n,), np.dtype(np.bool_)),
+            'has_seed': ((n,), np.dtype(np.bool_)),
+            'seed': ((n,), np.dtype(np.int64)),
+            'task_id': ((n,), np.dtype(np.int64)),
+        }
+        for key, (shape, dtype) in self.obs_fields.items():
+            specs['obs_' + key] = ((n, *shape), dtype)
+            specs['final_' + key] = ((n, *shape), dtype)
+
+        ctx = multiprocessing.get_context(context)
+        self._arrays = _SharedArrays.allocate(ctx, specs)
+        self._arrays['task_id'][:] = -1
+
+        self.conns = []
+        self.processes = []
+        bounds = np.linspace(0, n, num_workers + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child, env_fns[start:stop], int(start), specs, self._arrays.buffers),
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+        self.closed = False
+
+    def _call(self, cmd):
+        if self.closed:
+            raise RuntimeError("SGMGVectorEnv is closed")
+        for conn in self.conns:
+            conn.send_bytes(cmd)
+        errors = [msg for msg in (conn.recv_bytes() for conn in self.conns) if msg]
+        if errors:
+            # the failed block is left partly stepped, so the batch can't go on
+            self.close()
+            raise RuntimeError("error in SGMGVectorEnv worker:\n" + errors[0][1:].decode())
+
+    def _obs(self, prefix, copy):
+        obs = {}
+        for key in self.obs_fields:
+            array = self._arrays[prefix + key]
+            obs[key] = array.copy() if copy else array
+        return obs
+
+    def reset(self, seed=None, options=None, mask=None):
+        """
+        Reset all envs, or only those selected by the boolean `mask`.
+        `seed` is an int (env i gets seed + i) or a sequence of per-env seeds.
+        """
+        options = {} if options is None else options
+        arrays = self._arrays
+        arrays['reset_mask'][:] = True if mask is None else np.asarray(mask)
+        if seed is None:
+            arrays['has_seed'][:] = False
+        else:
+            arrays['has_seed'][:] = True
+            arrays['seed'][:] = seed + np.arange(self.num_envs) if np.isscalar(seed) else seed
+        task_id = options.get('task_id', None)
+        new_task_id = -1 if task_id is None else task_id
+        arrays['task_id'][:] = np.where(arrays['reset_mask'], new_task_id, arrays['task_id'])
+
+        self._call(RESET)
+        return self._obs('obs_', self.copy), {}
+
+    def step(self, actions):
+        arrays = self._arrays
+        arrays['actions'][:] = actions
+        self._call(STEP)
+
+        obs = self._obs('obs_', self.copy)
+        terminated = arrays['terminated'].copy()
+        truncated = arrays['truncated'].copy()
+        infos = {}
+        done = terminated | truncated
+        if done.any():
+            infos['final_observation'] = self._obs('final_', True)
+            infos['_final_observation'] = done
+        return obs, arrays['reward'].copy(), terminated, truncated, infos
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for conn in self.conns:
+            try:
+                conn.send_bytes(CLOSE)
+                conn.recv_bytes()
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        for conn in self.conns:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
@@ -1,12 +1,22 @@
+import json
+import os
+
 import numpy as np
 from gymnasium.core import ObservationWrapper, ObsType, Wrapper
 from gymnasium import spaces
-from minigrid.core.constants import COLOR_TO_IDX, STATE_TO_IDX
+from minigrid.core.constants import STATE_TO_IDX
 from sgminigrid.sgworld_object import NEW_OBJECT_TO_IDX
 
 class CompactCraftObsWrapper(ObservationWrapper):
+    """
+    Replaces the agent view with the compact codes of the whole grid. Envs
+    made with full_obs=True already emit them, and are passed through.
+    """
     def __init__(self, env):
         super().__init__(env)
+        self.full_obs = self.unwrapped.full_obs
+        if self.full_obs:
+            return
 
         new_image_space = spaces.Box(
             low=0,
@@ -19,14 +29,48 @@ class CompactCraftObsWrapper(ObservationWrapper):
             {**self.observation_space.spaces, "image": new_image_space}
         )
 
+    def reset(self, *, seed=None, options=None):
+        obs, info = self.env.reset(seed=seed, options=options)
+        if self.full_obs:
+            return obs, info
+        # compact grid without the agent, patched incrementally by step
+        self._cells = self._compress(self.unwrapped._grid_codes())
+        return self.observation(obs), info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        if self.full_obs:
+            return obs, reward, terminated, truncated, info
+        # only the cell in front of the agent (toggle/pickup/drop) can change
+        env = self.unwrapped
+        x, y = env.front_pos
+        self._cells[x, y] = self._compress_cell(env.grid.get(x, y))
+        return self.observation(obs), reward, terminated, truncated, info
+
+    def get_state(self):
+        return self.env.get_state()
+
+    def set_state(self, state):
+        self.env.set_state(state)
+        if self.full_obs:
+            return
+        self._cells = self._compress(self.unwrapped._grid_codes())
+
     def observation(self, obs):
         env = self.unwrapped
-        full_grid = env.grid.encode()
-        full_grid[env.agent_pos[0]][env.agent_pos[1]] = np.array(
-            [NEW_OBJECT_TO_IDX["agent"], COLOR_TO_IDX["red"], env.agent_dir]
-        )
+        image = self._cells.copy()
+        image[env.agent_pos[0], env.agent_pos[1]] = 3# agent
 
-        return {**obs, "image": self._compress(full_grid)}
+        return {**obs, "image": image}
+
+    @staticmethod
+    def _compress_cell(cell):
+        if cell is None:
+            return NEW_OBJECT_TO_IDX["empty"]
+        type_idx, _, state = cell.encode()
+        if type_idx == NEW_OBJECT_TO_IDX["collectible"] or type_idx == NEW_OBJECT_TO_IDX["interactable"]:
+            return 4 + state
+        return type_idx
 
     @staticmethod
     def _compress(obs):
@@ -41,3 +85,166 @@ class CompactCraftObsWrapper(ObservationWrapper):
         interactables = obs[:, :, 0] == 14
         buff[interactables] = 4 + obs[interactables, 2]
         return buff
+
+
+class _GrowableMemmap(object):
+    """Array backed by a raw file that doubles in size when full"""
+    def __init__(self, path, dtype, shape, capacity=1024):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.size = 0
+        self.capacity = 0
+        self.array = None
+        open(path, 'wb').close()# start a new recording
+        self._resize(capacity)
+
+    def _resize(self, capacity):
+        if self.array is not None:
+            self.array.flush()
+            del self.array
+        with open(self.path, 'ab') as f:
+            f.truncate(capacity * self.dtype.itemsize * int(np.prod(self.shape)))
+        self.array = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(capacity, *self.shape))
+        self.capacity = capacity
+
+    def extend(self, values):
+        n = len(values)
+        if self.size + n > self.capacity:
+            capacity = self.capacity
+            while self.size + n > capacity:
+                capacity *= 2
+            self._resize(capacity)
+        self.array[self.size:self.size + n] = values
+        self.size += n
+
+    def flush(self):
+        self.array.flush()
+
+
+class TrajectoryRecorder(Wrapper):
+    """
+    Records (observation, action, reward) transitions of an SGMG env into
+    per episode arrays, appended to memory-mapped files under `path` when
+    the episode ends. Completion bits are packed. Images are stored
+    compact (one uint8 code per cell, as in CompactCraftObsWrapper) when
+    the env's compact codes are lossless, and as full (type, color, state)
+    codes otherwise; meta.json records the 'image_layout'.
+
+    An existing recording at `path` is only replaced with overwrite=True.
+    """
+    def __init__(self, env, path, capacity=1024, overwrite=False):
+        super().__init__(env)
+        if os.path.exists(os.path.join(path, 'meta.json')) and not overwrite:
+            raise FileExistsError(f"{path} already holds a recording, pass overwrite=True to replace it")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+        image_shape = self.observation_space['image'].shape
+        if len(image_shape) == 3 and self.unwrapped.LOSSLESS_COMPACT:
+            image_shape = image_shape[:2]
+        self.image_layout = 'compact' if len(image_shape) == 2 else 'codes'
+        n_completion = self.observation_space['completion'].n
+        self.fields = {
+            'image': (np.uint8, image_shape),
+            'direction': (np.uint8, ()),
+            'mission_id': (np.int16, ()),
+            'completion': (np.uint8, ((n_completion + 7) // 8,)),
+            'action': (np.uint8, ()),
+            'reward': (np.float32, ()),
+            'terminated': (np.bool_, ()),
+            'truncated': (np.bool_, ()),
+        }
+        self.n_completion = n_completion
+        self.files = {
+            name: _GrowableMemmap(os.path.join(path, name + '.bin'), dtype, shape, capacity)
+            for name, (dtype, shape) in self.fields.items()
+        }
+        self.episode_end = _GrowableMemmap(os.path.join(path, 'episode_end.bin'), np.int64, (), 64)
+
+        self.buffers = {
+            name: np.zeros((capacity, *shape), dtype=dtype)
+            for name, (dtype, shape) in self.fields.items()
+        }
+        self.n = 0
+        self._obs = None
+
+    def _record(self, obs, action, reward, terminated, truncated):
+        if self.n == len(self.buffers['action']):
+            for name, buffer in self.buffers.items():
+                grown = np.zeros((2 * len(buffer), *buffer.shape[1:]), dtype=buffer.dtype)
+                grown[:self.n] = buffer
+                self.buffers[name] = grown
+        i = self.n
+        image = obs['image']
+        if self.image_layout == 'compact' and image.ndim == 3:
+            image = CompactCraftObsWrapper._compress(image)
+        self.buffers['image'][i] = image
+        self.buffers['direction'][i] = obs['direction']
+        self.buffers['mission_id'][i] = obs['mission_id']
+        self.buffers['completion'][i] = np.packbits(obs['completion'])
+        self.buffers['action'][i] = action
+        self.buffers['reward'][i] = reward
+        self.buffers['terminated'][i] = terminated
+        self.buffers['truncated'][i] = truncated
+        self.n += 1
+
+    def flush_episode(self):
+        """Append the transitions of the current episode to the files"""
+        if self.n == 0:
+            return
+        for name, buffer in self.buffers.items():
+            self.files[name].extend(buffer[:self.n])
+            self.files[name].flush()
+        self.episode_end.extend(np.array([self.files['action'].size]))
+        self.episode_end.flush()
+        self.n = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'steps': self.files['action'].size,
+            'episodes': self.episode_end.size,
+            'n_completion': self.n_completion,
+            'image_layout': self.image_layout,
+            'fields': {name: [np.dtype(dtype).str, list(shape)] for name, (dtype, shape) in self.fields.items()},
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def reset(self, *, seed=None, options=None):
+        self.flush_episode()# episode cut short by reset
+        obs, info = self.env.reset(seed=seed, options=options)
+        self._obs = obs
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        self._record(self._obs, action, reward, terminated, truncated)
+        self._obs = obs
+        if terminated or truncated:
+            self.flush_episode()
+        return obs, reward, terminated, truncated, info
+
+    def close(self):
+        self.flush_episode()
+        self._write_meta()
+        super().close()
+
+    @staticmethod
+    def load(path):
+        """
+        Read-only memory maps of a recording, plus 'episode_end' offsets
+        and the 'image_layout' of the images. Completion bits are left
+        packed, np.unpackbits(..., axis=-1, count=n_completion) restores them.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        n = meta['steps']
+        data = {}
+        for name, (dtype, shape) in meta['fields'].items():
+            data[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=dtype, mode='r', shape=(n, *shape)) if n else np.zeros((0, *shape), dtype=dtype)
+        data['episode_end'] = np.memmap(os.path.join(path, 'episode_end.bin'), dtype=np.int64, mode='r', shape=(meta['episodes'],)) if meta['episodes'] else np.zeros(0, np.int64)
+        data['n_completion'] = meta['n_completion']
+        data['image_layout'] = meta.get('image_layout', 'compact')# older recordings are compact
+        return data
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from sgminigrid.envs.crafting import Crafting
+from sgminigrid.envs.crafting_batch import BatchCrafting
+from sgminigrid.wrappers import CompactCraftObsWrapper
+
+N = 4
+ACTIONS = [0, 1, 2, 2, 2, 3, 5, 5, 6]
+
+
+def _assert_obs_equal(obs, batch_obs):
+    for i, o in enumerate(obs):
+        for key in batch_obs:
+            assert np.array_equal(np.asarray(o[key]), batch_obs[key][i]), key
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('compose, dist_bonus, fixed_pos, outer_place', [
+    (False, False, False, False),
+    (True, True, False, False),
+    (False, True, True, True),
+    (True, False, True, False),
+])
+def test_batch_matches_single_envs(compose, dist_bonus, fixed_pos, outer_place):
+    kwargs = dict(size=8, max_steps=50, compose=compose, dist_bonus=dist_bonus,
+                  fixed_pos=fixed_pos, outer_place=outer_place)
+    envs = [CompactCraftObsWrapper(Crafting(**kwargs)) for _ in range(N)]
+    batch = BatchCrafting(N, **kwargs)
+    rng = np.random.default_rng(0)
+
+    for episode in range(3):
+        task_ids = rng.integers(0, 8, N)
+        obs = [env.reset(seed=100 * episode + i, options={'task_id': int(task_ids[i])})[0]
+               for i, env in enumerate(envs)]
+        batch_obs, _ = batch.reset(seed=100 * episode, options={'task_id': task_ids})
+        _assert_obs_equal(obs, batch_obs)
+
+        for _ in range(50):
+            actions = rng.choice(ACTIONS, N)
+            results = [env.step(int(a)) for env, a in zip(envs, actions)]
+            batch_obs, rewards, terminated, truncated, _ = batch.step(actions)
+            _assert_obs_equal([r[0] for r in results], batch_obs)
+            assert [r[1] for r in results] == list(rewards)
+            assert [r[2] for r in results] == list(terminated)
+            assert [r[3] for r in results] == list(truncated)
+            if all(r[2] or r[3] for r in results):
+                break
@@ -0,0 +1,92 @@
+import itertools as it
+
+import gymnasium as gym
+import numpy as np
+import pytest
+
+import sgminigrid  # noqa: F401, registers the envs
+from sgminigrid.crafting_oracle import (
+    AGENT_ID, DIR_MAP, MISSION_OBJ, MISSIONS, BatchCraftingOracleActor, BatchHLCraftingOracleActor,
+    CraftingOracleActor, HLCraftingOracleActor, _build_flow,
+)
+from sgminigrid.wrappers import CompactCraftObsWrapper
+
+
+def _queue_flow(base_grid, orders):
+    """Flow map by a breadth-first queue per mission sequence, as _build_flow did before vectorizing"""
+    h, w = base_grid.shape
+    border = base_grid == 2
+    flow = np.full((*([MISSIONS]*orders), h, w, 4), 3 * h * w + 4, dtype=np.int_)
+    for order in range(orders):
+        for missions in it.permutations(range(MISSIONS), order+1):
+            cur_flow = flow[missions + (missions[-1],) * (orders - order - 1)]
+            prev_flow = flow[missions[1:] + (missions[-1],) * (orders - order)]
+            queue = []
+            for x, y in zip(*np.where(base_grid == MISSION_OBJ[missions[0]])):
+                for d, (xd, yd) in enumerate(DIR_MAP):
+                    if not border[x-xd, y-yd]:
+                        cur_flow[x-xd, y-yd, d] = 1 if order == 0 else prev_flow[x-xd, y-yd, d] + 1
+                        queue.append((x-xd, y-yd, d))
+            while queue:
+                x, y, d = queue.pop(0)
+                xd, yd = DIR_MAP[d]
+                neighbors = [(x, y, (d-1) % 4), (x, y, (d+1) % 4)]
+                if not border[x-xd, y-yd]:
+                    neighbors.append((x-xd, y-yd, d))
+                for state in neighbors:
+                    if cur_flow[x, y, d] + 1 < cur_flow[state]:
+                        cur_flow[state] = cur_flow[x, y, d] + 1
+                        queue.append(state)
+    return flow
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('orders', [1, 2])
+@pytest.mark.parametrize('env_id', ['SGMG-Crafting-v1', 'SGMG-Crafting-Compose-v0'])
+def test_vectorized_flow_matches_queue(env_id, orders):
+    env = CompactCraftObsWrapper(gym.make(env_id))
+    for seed in range(3):
+        base_grid = env.reset(seed=seed)[0]['image'].copy()
+        base_grid[base_grid == AGENT_ID] = 1
+        # interior walls for less open layouts
+        rng = np.random.default_rng(seed)
+        for x, y in rng.integers(1, base_grid.shape[0] - 1, (6, 2)):
+            if base_grid[x, y] == 1:
+                base_grid[x, y] = 2
+        assert np.array_equal(_build_flow(base_grid, orders), _queue_flow(base_grid, orders))
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('orders', [1, 2])
+@pytest.mark.parametrize('env_id, single_cls, batch_cls', [
+    ('SGMG-Crafting-v1', CraftingOracleActor, BatchCraftingOracleActor),
+    ('SGMG-Crafting-Compose-v0', HLCraftingOracleActor, BatchHLCraftingOracleActor),
+])
+def test_batch_actor_matches_single_actors(env_id, single_cls, batch_cls, orders):
+    n = 4
+    envs = [CompactCraftObsWrapper(gym.make(env_id)) for _ in range(n)]
+    space = envs[0].observation_space
+    singles = [single_cls(None, None, space, None, nth_order=orders) for _ in range(n)]
+    batch = batch_cls(None, None, space, None, n, nth_order=orders)
+
+    def stack(obs):
+        return {key: np.stack([o[key] for o in obs]) for key in obs[0] if key != 'mission'}
+
+    obs = [env.reset(seed=i)[0] for i, env in enumerate(envs)]
+    for actor, o in zip(singles, obs):
+        actor.observe_first(o, {})
+    batch.observe_first(stack(obs), {})
+    for t in range(150):
+        actions = np.array([actor.act() for actor in singles])
+        assert np.array_equal(batch.act(), actions)
+        results = [env.step(a) for env, a in zip(envs, actions)]
+        obs = [r[0] for r in results]
+        for actor, o, a in zip(singles, obs, actions):
+            actor.observe(o, a, {})
+        batch.observe(stack(obs), actions, {})
+        done = np.array([r[2] or r[3] for r in results])
+        if done.any():
+            for i in np.flatnonzero(done):
+                obs[i] = envs[i].reset(seed=100 + t * n + int(i))[0]
+                singles[i].observe_first(obs[i], {})
+            batch.observe_first(stack(obs), {}, mask=done)
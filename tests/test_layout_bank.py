@@ -0,0 +1,49 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+
+import sgminigrid  # noqa: F401, registers the envs
+from sgminigrid.layout_bank import generate_bank
+
+N = 8
+BASE_SEED = 100
+
+
+def _assert_obs_equal(a, b):
+    assert a.keys() == b.keys()
+    for key in a:
+        assert np.array_equal(np.asarray(a[key]), np.asarray(b[key])), key
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('array_grid', [False, True])
+@pytest.mark.parametrize('env_id', ['SGMG-Crafting-Bonus-v0', 'SGMG-Crafting-Compose-v1', 'SGMG-BDoor-v0', 'SGMG-BDoorLFCG-v0'])
+def test_bank_reset_matches_direct_reset(tmp_path, env_id, array_grid):
+    generate_bank(env_id, str(tmp_path), N, base_seed=BASE_SEED, chunk_size=3)
+    live = gym.make(env_id, array_grid=array_grid).unwrapped
+    banked = gym.make(env_id, layout_bank=str(tmp_path), array_grid=array_grid).unwrapped
+
+    for i in range(N):
+        live.np_random = np.random.Generator(np.random.PCG64(BASE_SEED + i))
+        expected = live.reset(seed=BASE_SEED + i)
+        # both a seeded reset and an explicit index pick layout i
+        options = {'layout_index': i} if i % 2 else None
+        result = banked.reset(seed=None if options else BASE_SEED + i, options=options)
+        _assert_obs_equal(result[0], expected[0])
+        assert result[1] == expected[1]
+
+        rng = np.random.default_rng(i)
+        for t in range(40):
+            action = int(rng.integers(0, 7)) if t % 3 else 5
+            expected = live.step(action)
+            result = banked.step(action)
+            _assert_obs_equal(result[0], expected[0])
+            assert result[1:4] == expected[1:4]
+            if expected[2] or expected[3]:
+                break
+
+
+@pytest.mark.filterwarnings('ignore')
+def test_unsupported_env_raises(tmp_path):
+    with pytest.raises(ValueError):
+        generate_bank('SGMG-ButtonTest-v0', str(tmp_path), 1)
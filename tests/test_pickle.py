@@ -0,0 +1,44 @@
+import pickle
+
+import gymnasium as gym
+import numpy as np
+import pytest
+
+import sgminigrid  # noqa: F401, registers the envs
+
+ENV_IDS = sorted(k for k in gym.registry if k.startswith('SGMG-'))
+
+
+def _round_trip(env):
+    return pickle.loads(pickle.dumps(env))
+
+
+def _assert_obs_equal(a, b):
+    assert a.keys() == b.keys()
+    for key in a:
+        assert np.array_equal(np.asarray(a[key]), np.asarray(b[key])), key
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('env_id', ENV_IDS)
+def test_double_round_trip(env_id):
+    kwargs = {'full_obs': True} if env_id.startswith('SGMG-Crafting') else {}
+    env = gym.make(env_id, **kwargs).unwrapped
+    rng = np.random.default_rng(0)
+    env.reset(seed=0, options={'task_id': 0})
+    for action in rng.integers(0, env.action_space.n, 10):
+        env.step(int(action))
+
+    copy = _round_trip(_round_trip(env))
+    assert copy._init_args == env._init_args
+    assert copy.observation_space['image'] == env.observation_space['image']
+    assert copy.observation_space['completion'] == env.observation_space['completion']
+    _assert_obs_equal(copy.gen_obs(), env.gen_obs())
+
+    for action in rng.integers(0, env.action_space.n, 50):
+        expected = env.step(int(action))
+        result = copy.step(int(action))
+        _assert_obs_equal(result[0], expected[0])
+        assert result[1:4] == expected[1:4]
+        if expected[2] or expected[3]:
+            _assert_obs_equal(copy.reset(seed=1)[0], env.reset(seed=1)[0])
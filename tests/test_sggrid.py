@@ -0,0 +1,32 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+from minigrid.wrappers import FullyObsWrapper
+
+import sgminigrid  # noqa: F401, registers the envs
+from sgminigrid.sggrid import SGGrid
+
+
+@pytest.mark.filterwarnings('ignore')
+def test_encode_is_a_writable_copy():
+    env = gym.make('SGMG-BDoor-v0', array_grid=True).unwrapped
+    env.reset(seed=0, options={'task_id': 0})
+    assert isinstance(env.grid, SGGrid)
+
+    codes = env.grid.encode()
+    assert codes.flags.writeable
+    assert np.array_equal(codes, env.grid.codes)
+    codes[...] = 0
+    assert not np.array_equal(codes, env.grid.codes)
+    assert not env.grid.codes_view().flags.writeable
+
+
+@pytest.mark.filterwarnings('ignore')
+def test_fully_obs_wrapper():
+    expected = FullyObsWrapper(gym.make('SGMG-BDoor-v0'))
+    env = FullyObsWrapper(gym.make('SGMG-BDoor-v0', array_grid=True))
+    options = {'task_id': 0}
+    assert np.array_equal(env.reset(seed=0, options=options)[0]['image'],
+                          expected.reset(seed=0, options=options)[0]['image'])
+    for action in np.random.default_rng(0).integers(0, env.action_space.n, 30):
+        assert np.array_equal(env.step(int(action))[0]['image'], expected.step(int(action))[0]['image'])
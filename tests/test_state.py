@@ -0,0 +1,61 @@
+import copy
+
+import gymnasium as gym
+import numpy as np
+import pytest
+
+import sgminigrid  # noqa: F401, registers the envs
+from sgminigrid.wrappers import CompactCraftObsWrapper
+
+ENV_IDS = sorted(k for k in gym.registry if k.startswith('SGMG-'))
+
+
+def _assert_obs_equal(a, b):
+    assert a.keys() == b.keys()
+    for key in a:
+        assert np.array_equal(np.asarray(a[key]), np.asarray(b[key])), key
+
+
+def _check_branch(env, seed):
+    """Diverge from a snapshot, restore it and replay against a deep copy taken at the snapshot"""
+    rng = np.random.default_rng(seed)
+    env.reset(seed=seed, options={'task_id': 0})
+    actions = rng.integers(0, 7, 60)
+    start = int(rng.integers(0, 20))
+    for action in actions[:start]:
+        result = env.step(int(action))
+        if result[2] or result[3]:
+            return
+
+    state = env.get_state()
+    expected = copy.deepcopy(env)
+    for action in rng.integers(0, 7, 15):
+        result = env.step(int(action))
+        if result[2] or result[3]:
+            break
+    env.set_state(state)
+
+    for action in actions[start:]:
+        result = env.step(int(action))
+        reference = expected.step(int(action))
+        _assert_obs_equal(result[0], reference[0])
+        assert result[1:4] == reference[1:4]
+        if reference[2] or reference[3]:
+            break
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('array_grid', [False, True])
+@pytest.mark.parametrize('env_id', ENV_IDS)
+def test_set_state_branches(env_id, array_grid):
+    env = gym.make(env_id, array_grid=array_grid).unwrapped
+    for seed in range(4):
+        _check_branch(env, seed)
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('env_id', ['SGMG-Crafting-v0', 'SGMG-Crafting-Compose-v1'])
+def test_compact_wrapper_set_state_branches(env_id):
+    env = CompactCraftObsWrapper(gym.make(env_id, array_grid=True))
+    for seed in range(4):
+        _check_branch(env, seed)
@@ -0,0 +1,80 @@
+import functools
+
+import gymnasium as gym
+import numpy as np
+import pytest
+
+import sgminigrid  # noqa: F401, registers the envs
+from sgminigrid.vector import SGMGVectorEnv
+from sgminigrid.wrappers import CompactCraftObsWrapper
+
+N = 6
+TASK_IDS = [0, 1, 2, 3, 0, 1]
+
+
+def _make(env_id, compact=False):
+    env = gym.make(env_id)
+    return CompactCraftObsWrapper(env) if compact else env
+
+
+class _FailingStep(gym.Wrapper):
+    def __init__(self, env):
+        super().__init__(env)
+        self.steps = 0
+
+    def step(self, action):
+        self.steps += 1
+        if self.steps == 3:
+            raise ValueError('step failed')
+        return self.env.step(action)
+
+
+def _make_failing(env_id):
+    return _FailingStep(gym.make(env_id))
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('env_id, compact', [
+    ('SGMG-Crafting-v1', True),
+    ('SGMG-Crafting-Compose-v0', False),
+    ('SGMG-BDoorLFCG-v0', False),
+])
+def test_vector_env_matches_sequential_envs(env_id, compact):
+    env_fns = [functools.partial(_make, env_id, compact) for _ in range(N)]
+    envs = [env_fn() for env_fn in env_fns]
+    rng = np.random.default_rng(0)
+    with SGMGVectorEnv(env_fns, num_workers=3) as venv:
+        obs, _ = venv.reset(seed=10, options={'task_id': TASK_IDS})
+        for i, env in enumerate(envs):
+            expected = env.reset(seed=10 + i, options={'task_id': TASK_IDS[i]})[0]
+            for key in venv.obs_fields:
+                assert np.array_equal(obs[key][i], expected[key]), key
+
+        for _ in range(100):
+            actions = rng.integers(0, 7, N)
+            obs, rewards, terminated, truncated, infos = venv.step(actions)
+            for i, env in enumerate(envs):
+                expected, reward, term, trunc, _ = env.step(int(actions[i]))
+                assert (reward, term, trunc) == (rewards[i], terminated[i], truncated[i])
+                if term or trunc:
+                    assert infos['_final_observation'][i]
+                    for key in venv.obs_fields:
+                        assert np.array_equal(infos['final_observation'][key][i], expected[key]), key
+                    # autoresets keep the task id
+                    expected = env.reset(options={'task_id': TASK_IDS[i]})[0]
+                for key in venv.obs_fields:
+                    assert np.array_equal(obs[key][i], expected[key]), key
+
+
+@pytest.mark.filterwarnings('ignore')
+def test_worker_error_closes():
+    env_fns = [functools.partial(_make_failing, 'SGMG-Crafting-v1')] * 4
+    venv = SGMGVectorEnv(env_fns, num_workers=2)
+    venv.reset(seed=0)
+    with pytest.raises(RuntimeError, match='step failed'):
+        for _ in range(5):
+            venv.step(np.full(4, 2))
+    assert venv.closed
+    assert not any(process.is_alive() for process in venv.processes)
+    with pytest.raises(RuntimeError):
+        venv.step(np.full(4, 2))
@@ -0,0 +1,30 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+
+import sgminigrid  # noqa: F401, registers the envs
+from sgminigrid.wrappers import CompactCraftObsWrapper
+
+
+def _full_compact(wrapper):
+    """Compact image rebuilt from the whole grid, as before incremental updates"""
+    env = wrapper.unwrapped
+    image = wrapper._compress(env.grid.encode())
+    image[env.agent_pos[0], env.agent_pos[1]] = 3
+    return image
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('array_grid', [False, True])
+@pytest.mark.parametrize('env_id', ['SGMG-Crafting-v0', 'SGMG-Crafting-Compose-v0', 'SGMG-BDoor-v0'])
+def test_incremental_matches_full(env_id, array_grid):
+    wrapper = CompactCraftObsWrapper(gym.make(env_id, array_grid=array_grid))
+    rng = np.random.default_rng(1)
+    for episode in range(3):
+        obs, _ = wrapper.reset(seed=episode, options={'task_id': episode})
+        assert np.array_equal(obs['image'], _full_compact(wrapper))
+        for action in rng.choice([0, 1, 2, 2, 3, 4, 5, 5], 100):
+            obs, _, terminated, truncated, _ = wrapper.step(int(action))
+            assert np.array_equal(obs['image'], _full_compact(wrapper))
+            if terminated or truncated:
+                break